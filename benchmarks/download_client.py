@@ -0,0 +1,156 @@
+"""Compare sequential, parallel and adaptive downloads against a local HTTP server.
+
+The server can simulate a shared bandwidth limit, random errors and a connection limit above
+which it rejects requests with 503, to check how the adaptive concurrency controller reacts.
+
+Usage: python -m benchmarks.download_client [--files 200] [--size 65536] [--latency 0.05] [--workers 1 4 8]
+                                            [--bandwidth 0] [--error-rate 0] [--max-connections 0] [--adaptive 16]
+"""
+import argparse
+import http.server
+import io
+import logging
+import random
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+
+from pathlib import Path
+
+from usb_installer.downloader import ConcurrencyController, DownloadClient
+
+
+class Link:
+    """Bandwidth shared by all connections of the server."""
+
+    def __init__(self, bandwidth: int):
+        self.bandwidth = bandwidth
+        self.next_free = 0.0
+        self.lock = threading.Lock()
+
+    def send(self, wfile, data: bytes, chunk_size: int = 16 * 1024):
+        for i in range(0, len(data), chunk_size):
+            chunk = data[i:i + chunk_size]
+
+            if self.bandwidth > 0:
+                # Reserve the time slot of this chunk on the link
+                with self.lock:
+                    self.next_free = max(self.next_free, time.monotonic()) + len(chunk) / self.bandwidth
+                    send_time = self.next_free
+
+                time.sleep(max(0.0, send_time - time.monotonic()))
+
+            wfile.write(chunk)
+
+
+def make_payload(size: int) -> bytes:
+    buffer = io.BytesIO()
+
+    # Stored zip so the payload size matches the requested size
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as zf:
+        zf.writestr("data.bin", b"\0" * size)
+
+    return buffer.getvalue()
+
+
+def make_handler(payload: bytes, latency: float, link: Link, error_rate: float = 0.0, max_connections: int = 0):
+    connections = 0
+    lock = threading.Lock()
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            nonlocal connections
+
+            with lock:
+                connections += 1
+                overloaded = 0 < max_connections < connections
+
+            try:
+                # Simulate the round-trip latency of the real server
+                time.sleep(latency)
+
+                if overloaded or random.random() < error_rate:
+                    self.send_response(503)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/zip")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                link.send(self.wfile, payload)
+            finally:
+                with lock:
+                    connections -= 1
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def run(base_url: str, files: int, workers: int, max_workers: int = 0) -> float:
+    download_dir = Path(tempfile.mkdtemp())
+    urls = [f"{base_url}/asset_{i}_r1.zip" for i in range(files)]
+
+    def completion_callback(url: str, file_path: Path):
+        file_path.unlink(missing_ok=True)
+
+    def error_callback(url: str, exc: Exception):
+        print(f"Failed to download {url}: {exc}")
+
+    controller = ConcurrencyController(workers, max_limit=max_workers, interval=1.0) if max_workers > workers else None
+
+    try:
+        client = DownloadClient(urls, download_dir, completion_callback, error_callback, max_workers=workers, controller=controller)
+        start_time = time.perf_counter()
+        client.start(daemon=True)
+        return time.perf_counter() - start_time
+    finally:
+        shutil.rmtree(download_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--size", type=int, default=64 * 1024)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--bandwidth", type=float, default=0, help="shared bandwidth in MB/s, 0 for unlimited")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument("--max-connections", type=int, default=0, help="reject requests above this many connections with 503")
+    parser.add_argument("--adaptive", type=int, default=0, metavar="MAX_WORKERS", help="also run with the adaptive controller up to MAX_WORKERS")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log the decisions of the controller")
+    args = parser.parse_args()
+
+    if args.verbose:
+        logging.basicConfig(level=logging.INFO, format="%(message)s")
+        logging.getLogger("usb_installer.downloader.client").setLevel(logging.WARNING)
+
+    link = Link(int(args.bandwidth * 1024 ** 2))
+    handler = make_handler(make_payload(args.size), args.latency, link, args.error_rate, args.max_connections)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    try:
+        runs = [(f"workers={workers}", workers, 0) for workers in args.workers]
+
+        if args.adaptive > 0:
+            runs.append((f"adaptive<={args.adaptive}", 1, args.adaptive))
+
+        for name, workers, max_workers in runs:
+            elapsed = run(base_url, args.files, workers, max_workers)
+            total_mb = args.files * args.size / 1024 ** 2
+            print(f"{name:<14} {elapsed:8.2f}s {args.files / elapsed:8.1f} files/s {total_mb / elapsed:8.2f} MB/s")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
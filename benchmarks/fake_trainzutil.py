@@ -0,0 +1,79 @@
+"""Stand-in for TrainzUtil.exe to run the installer on Linux.
+
+Commands are taken from the command line like the real TrainzUtil, or line by line from stdin
+when started without arguments. Latencies are read from the environment:
+
+    FAKE_TRAINZUTIL_STARTUP   process start and database handshake (default 0.3s)
+    FAKE_TRAINZUTIL_LATENCY   time per command (default 0.01s)
+    FAKE_TRAINZUTIL_INSTALL   additional time per installfrompath (default 0.05s)
+    FAKE_TRAINZUTIL_FAIL      commands that exit with status 1 without an error line (comma-separated)
+"""
+import os
+import re
+import shlex
+import sys
+import time
+
+from pathlib import Path
+
+STARTUP_LATENCY = float(os.environ.get("FAKE_TRAINZUTIL_STARTUP", 0.3))
+COMMAND_LATENCY = float(os.environ.get("FAKE_TRAINZUTIL_LATENCY", 0.01))
+INSTALL_LATENCY = float(os.environ.get("FAKE_TRAINZUTIL_INSTALL", 0.05))
+FAILING_COMMANDS = {command.strip().lower() for command in os.environ.get("FAKE_TRAINZUTIL_FAIL", "").split(",") if command.strip()}
+
+KUID_PATTERN = re.compile(r"^kuid\s+(<[^>]+>)", re.MULTILINE)
+
+
+def run_command(command: str, *args: str) -> int:
+    time.sleep(COMMAND_LATENCY)
+    command = command.lower()
+
+    if command in FAILING_COMMANDS:
+        return 1
+
+    if command == "echo":
+        print(" ".join(args))
+    elif command == "version":
+        print("Version 49922")
+    elif command == "installfrompath":
+        time.sleep(INSTALL_LATENCY)
+        config_file = Path(args[0]) / "config.txt"
+
+        if not config_file.exists():
+            print(f"- installfrompath : config.txt not found in {args[0]}")
+            return 1
+
+        match = KUID_PATTERN.search(config_file.read_text(encoding="utf-8", errors="replace"))
+        print(f"+ Installed asset {match.group(1) if match else '<kuid:0:0>'}")
+    elif command in ("delete", "commit", "revert"):
+        print(f"+ {command} <{args[0]}> : OK")
+    elif command == "status":
+        print(f"+ <{args[0]}> : .I..... : OK")
+    else:
+        print(f"- {command} : Unknown command")
+        return 1
+
+    return 0
+
+
+def main() -> int:
+    time.sleep(STARTUP_LATENCY)
+
+    if len(sys.argv) > 1:
+        return run_command(*sys.argv[1:])
+
+    # Persistent mode, one command per line, $? is replaced with the exit status of the previous command
+    returncode = 0
+
+    for line in sys.stdin:
+        args = shlex.split(line, posix=os.name != "nt")
+
+        if args:
+            returncode = run_command(*[str(returncode) if arg == "$?" else arg for arg in args])
+            sys.stdout.flush()
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,259 @@
+"""Run a complete installation headless against a local asset server and the fake TrainzUtil.
+
+Generates a synthetic manifest and asset archives, serves them from a local HTTP server with
+optional latency, bandwidth limit and errors, and drives AssetInstaller through a stub window
+with the fake TrainzUtil. Reports assets/s, MB/s and the time spent in every pipeline stage.
+
+Archive sizes follow a log-normal distribution around --size, textures are noise images which
+are only downscaled with --downscale. The latencies of the fake TrainzUtil can be set with
+--trainzutil-startup, --trainzutil-latency and --trainzutil-install. The fake TrainzUtil runs as a
+persistent session unless --no-session is given.
+
+Usage: python -m benchmarks.installer [--assets 100] [--size 262144] [--size-spread 1.0] [--textures 0]
+                                      [--texture-size 1024] [--downscale] [--latency 0.02] [--bandwidth 0]
+                                      [--error-rate 0] [--download-workers 4] [--max-download-workers 0]
+                                      [--no-session] [--trace FILE] [--seed 0]
+"""
+import argparse
+import functools
+import hashlib
+import http.server
+import io
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from PIL import Image
+
+import usb_installer.assets
+import usb_installer.installer
+
+from benchmarks.download_client import Link
+from usb_installer.store import InstallState
+from usb_installer.trainz import TrainzUtil
+
+FAKE_TRAINZUTIL = [sys.executable, str(Path(__file__).parent / "fake_trainzutil.py")]
+
+DOWNLOAD_VERSION = "full"
+
+
+class StubWindow:
+    """Takes the place of the webview window, only remembers what the installer shows."""
+
+    def __init__(self):
+        self.calls = 0
+        self.result = None
+
+    def evaluate_js(self, script: str):
+        self.calls += 1
+
+        if script.startswith("showError("):
+            self.result = script
+
+
+def make_texture(size: int) -> bytes:
+    buffer = io.BytesIO()
+
+    # Noise doesn't compress, like most real textures
+    Image.effect_noise((size, size), 64).convert("RGB").save(buffer, "TGA")
+    return buffer.getvalue()
+
+
+def make_asset(kuid: str, size: int, textures: List[bytes]) -> bytes:
+    buffer = io.BytesIO()
+
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as zf:
+        zf.writestr("config.txt", f'kuid <{kuid}>\nusername "Benchmark_Asset"\nkind "scenery"\ntrainz-build 4.6\n')
+
+        for i, texture in enumerate(textures):
+            zf.writestr(f"texture_{i}.tga", texture)
+
+        # Fill the archive up to the drawn size
+        zf.writestr("data.bin", random.randbytes(max(0, size - sum(map(len, textures)))))
+
+    return buffer.getvalue()
+
+
+def make_assets(count: int, size: int, size_spread: float, textures: int, texture_size: int) -> Tuple[Dict[str, bytes], bytes]:
+    files = {}
+    assets = []
+
+    # The same textures in every asset, generating them is slower than the installation
+    texture_data = [make_texture(texture_size) for _ in range(textures)]
+
+    for i in range(count):
+        kuid = f"kuid:1041339:{200000 + i}"
+        file_id = f"asset{i:05d}"
+        data = make_asset(kuid, int(random.lognormvariate(0, size_spread) * size), texture_data)
+
+        files[f"/assets-new/{DOWNLOAD_VERSION}/{file_id}_r1.zip"] = data
+        assets.append({"username": "Benchmark", "kuid": kuid, "sha1": hashlib.sha1(data).hexdigest(), "fileId": file_id, "revision": 1})
+
+    manifest = json.dumps({"assets": assets, "lastRevision": 1}).encode("utf-8")
+    return files, manifest
+
+
+def make_handler(files: Dict[str, bytes], latency: float, link: Link, error_rate: float = 0.0):
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send_headers(self, data: bytes, content_type: str):
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+
+        def _send_error(self, status: int):
+            self.send_response(status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def do_HEAD(self):
+            time.sleep(latency)
+            data = files.get(self.path.split("?")[0])
+
+            if data is None:
+                self._send_error(404)
+                return
+
+            self._send_headers(data, "application/octet-stream")
+
+        def do_GET(self):
+            # Simulate the round-trip latency of the real server
+            time.sleep(latency)
+            path = self.path.split("?")[0]
+            data = files.get(path)
+
+            if data is None:
+                self._send_error(404)
+                return
+
+            # Only downloads of archives fail, the manifest is always served
+            if path.endswith(".zip") and random.random() < error_rate:
+                self._send_error(503)
+                return
+
+            self._send_headers(data, "application/zip" if path.endswith(".zip") else "application/json")
+            link.send(self.wfile, data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def run(base_url: str, work_dir: Path, args: argparse.Namespace) -> Tuple[usb_installer.installer.AssetInstaller, StubWindow, float]:
+    user_data_path = work_dir / "UserData"
+    install_path = work_dir / "Trainz"
+    user_data_path.mkdir()
+    (install_path / "UserData" / "settings").mkdir(parents=True)
+    (install_path / "trainzoptions.txt").write_text("-freeintcam\n", encoding="utf-8")
+
+    # Point the installer at the local server and the fake TrainzUtil, and skip the pauses
+    usb_installer.installer.ASSETS_URL = f"{base_url}/api/assets.json"
+    usb_installer.assets.ASSETS_BASE_URL = f"{base_url}/assets-new"
+    usb_installer.installer.USER_DATA_PATH = user_data_path
+    usb_installer.installer.START_DELAY = (0, 0)
+    usb_installer.installer.FINISH_DELAY = (0, 0)
+    usb_installer.installer.TrainzUtil = functools.partial(TrainzUtil, executable=FAKE_TRAINZUTIL)
+    usb_installer.installer.set_taskbar_progress = lambda *args, **kwargs: None
+
+    window = StubWindow()
+    installer = usb_installer.installer.AssetInstaller(
+        window,
+        install_path,
+        DOWNLOAD_VERSION,
+        downscale_textures=args.downscale,
+        download_workers=args.download_workers,
+        install_state=InstallState(user_data_path / "install.db"),
+        max_download_workers=args.max_download_workers,
+        trace=args.trace is not None,
+        persistent_trainzutil=not args.no_session,
+    )
+
+    start_time = time.perf_counter()
+    installer.start()
+    installer.installer_thread.join()
+    elapsed = time.perf_counter() - start_time
+
+    if args.trace is not None:
+        trace_files = sorted((user_data_path / "Traces").glob("*.json"))
+
+        if trace_files:
+            shutil.copy(trace_files[-1], args.trace)
+
+    return installer, window, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--assets", type=int, default=100)
+    parser.add_argument("--size", type=int, default=256 * 1024, help="median archive size in bytes")
+    parser.add_argument("--size-spread", type=float, default=1.0, help="sigma of the log-normal size distribution")
+    parser.add_argument("--textures", type=int, default=0, help="textures per asset")
+    parser.add_argument("--texture-size", type=int, default=1024)
+    parser.add_argument("--downscale", action="store_true", help="downscale the textures during installation")
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--bandwidth", type=float, default=0, help="shared bandwidth in MB/s, 0 for unlimited")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of downloads answered with 503")
+    parser.add_argument("--download-workers", type=int, default=4)
+    parser.add_argument("--max-download-workers", type=int, default=0, help="let the adaptive controller go up to this many downloads")
+    parser.add_argument("--trainzutil-startup", type=float, default=0.3)
+    parser.add_argument("--trainzutil-latency", type=float, default=0.01)
+    parser.add_argument("--trainzutil-install", type=float, default=0.05)
+    parser.add_argument("--no-session", action="store_true", help="run every TrainzUtil command in its own process")
+    parser.add_argument("--trace", type=Path, metavar="FILE", help="write a Chrome trace of the installation")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-v", "--verbose", action="store_true", help="show the log of the installer")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.CRITICAL, format="%(threadName)s %(name)s: %(message)s")
+    random.seed(args.seed)
+
+    # Inherited by the fake TrainzUtil processes
+    os.environ["FAKE_TRAINZUTIL_STARTUP"] = str(args.trainzutil_startup)
+    os.environ["FAKE_TRAINZUTIL_LATENCY"] = str(args.trainzutil_latency)
+    os.environ["FAKE_TRAINZUTIL_INSTALL"] = str(args.trainzutil_install)
+
+    generate_time = time.perf_counter()
+    files, manifest = make_assets(args.assets, args.size, args.size_spread, args.textures, args.texture_size)
+    files["/api/assets.json"] = manifest
+    total_mb = sum(len(data) for path, data in files.items() if path.endswith(".zip")) / 1024 ** 2
+    print(f"Generated {args.assets} assets ({total_mb:.1f} MB) in {time.perf_counter() - generate_time:.1f}s")
+
+    link = Link(int(args.bandwidth * 1024 ** 2))
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), make_handler(files, args.latency, link, args.error_rate))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    try:
+        with tempfile.TemporaryDirectory() as work_dir:
+            installer, window, elapsed = run(f"http://127.0.0.1:{server.server_address[1]}", Path(work_dir), args)
+    finally:
+        server.shutdown()
+
+    stats = installer.stats.snapshot()
+    print(f"Result: {window.result}")
+    print(f"Installed {stats.get('installed', 0)} of {args.assets} assets in {elapsed:.2f}s ({window.calls} window updates)")
+    print(f"{args.assets / elapsed:8.1f} assets/s {total_mb / elapsed:8.2f} MB/s")
+
+    print(f"\n{'stage':<10} {'workers':>7} {'done':>6} {'busy':>9} {'blocked':>9} {'per asset':>10}")
+    for stage_stats in installer.pipeline.stats():
+        per_asset = stage_stats.busy_time / stage_stats.processed_count * 1000 if stage_stats.processed_count else 0
+        print(f"{stage_stats.name:<10} {stage_stats.workers:>7} {stage_stats.processed_count:>6} {stage_stats.busy_time:8.2f}s {stage_stats.blocked_time:8.2f}s {per_asset:8.1f}ms")
+
+    if args.trace is not None:
+        print(f"\nTrace written to {args.trace}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Report the import time of the installer modules loaded before the window appears.
+
+Imports the module in a fresh interpreter with -X importtime, no window is created. Prints the
+slowest modules by cumulative import time and fails if the total exceeds the budget.
+
+Usage: python -m benchmarks.startup [--module usb_installer.api] [--top 25] [--repeat 3] [--budget 400]
+"""
+import argparse
+import re
+import subprocess
+import sys
+
+from typing import Dict, Tuple
+
+IMPORT_TIME_PATTERN = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+
+def measure(module: str) -> Dict[str, Tuple[int, int, int]]:
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True, text=True)
+
+    if result.returncode != 0:
+        raise SystemExit(f"Failed to import {module}:\n{result.stderr}")
+
+    # Module -> (self time, cumulative time, nesting level) in microseconds
+    times = {}
+
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME_PATTERN.match(line)
+
+        if match:
+            times[match.group(4)] = (int(match.group(1)), int(match.group(2)), len(match.group(3)) // 2)
+
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="usb_installer.api")
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--repeat", type=int, default=3, help="keep the fastest of several runs")
+    parser.add_argument("--budget", type=float, default=400, help="maximum cumulative import time in ms")
+    parser.add_argument("--forbid", nargs="*", default=["usb_installer.installer", "PIL", "sqlalchemy", "requests", "clr", "wmi"], help="modules that must not be imported at start-up")
+    args = parser.parse_args()
+
+    runs = [measure(args.module) for _ in range(max(1, args.repeat))]
+    times = min(runs, key=lambda run: run[args.module][1])
+    total_ms = times[args.module][1] / 1000
+
+    print(f"{'cumulative':>12} {'self':>10}  module")
+    for name, (self_time, cumulative_time, level) in sorted(times.items(), key=lambda item: item[1][1], reverse=True)[:args.top]:
+        print(f"{cumulative_time / 1000:10.1f}ms {self_time / 1000:8.1f}ms  {'  ' * level}{name}")
+
+    print(f"\nImporting {args.module} took {total_ms:.1f} ms ({len(times)} modules, budget {args.budget:.0f} ms)")
+
+    # Heavy dependencies only needed once an installation starts
+    forbidden = sorted(name for name in times if name.split(".")[0] in args.forbid or name in args.forbid)
+    if forbidden:
+        print(f"Imported at start-up although deferred: {', '.join(forbidden)}")
+
+    if total_ms > args.budget or forbidden:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
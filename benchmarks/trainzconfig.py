@@ -0,0 +1,63 @@
+"""Measure how fast TrainzConfig parses config.txt files.
+
+Usage: python -m benchmarks.trainzconfig [PATH ...] [--repeat 20]
+
+PATH can be a config.txt file or a directory that is searched for config.txt files. Without
+paths a synthetic config file is generated.
+"""
+import argparse
+import tempfile
+import time
+
+from pathlib import Path
+from typing import List
+
+from usb_installer.trainz import TrainzConfig
+
+
+def make_config(blocks: int = 200) -> str:
+    lines = ['kuid <kuid:1041339:100001>', 'username "Synthetic_Asset"', 'kind "traincar"', 'trainz-build 4.6']
+
+    for i in range(blocks):
+        lines += [f"mesh-{i}", "{", f'  mesh "mesh_{i}.trainzmesh"', "  auto-create 1", f"  offset 0.{i},1.5,-2", "}"]
+
+    lines += ["kuid-table", "{"] + [f"  {i} <kuid:1041339:{i}>" for i in range(blocks)] + ["}"]
+    return "\n".join(lines)
+
+
+def find_configs(paths: List[str]) -> List[Path]:
+    configs = []
+
+    for path in map(Path, paths):
+        configs += sorted(path.rglob("config.txt")) if path.is_dir() else [path]
+
+    return configs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        configs = find_configs(args.paths)
+
+        if not configs:
+            configs = [Path(temp_dir) / "config.txt"]
+            configs[0].write_text(make_config(), encoding="utf-8")
+
+        total_size = sum(config.stat().st_size for config in configs)
+        start_time = time.perf_counter()
+
+        for _ in range(args.repeat):
+            for config in configs:
+                TrainzConfig(config, encoding="auto")
+
+        elapsed = time.perf_counter() - start_time
+        parsed_count = len(configs) * args.repeat
+        print(f"{parsed_count} files in {elapsed:.2f}s: {elapsed / parsed_count * 1e6:.0f} us/file, {total_size * args.repeat / elapsed / 1024 ** 2:.2f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""Compare one-shot and persistent TrainzUtil sessions using the fake TrainzUtil.
+
+Usage: python -m benchmarks.trainzutil [--assets 20]
+"""
+import argparse
+import sys
+import tempfile
+import time
+
+from pathlib import Path
+
+from usb_installer.trainz import TrainzUtil
+
+FAKE_TRAINZUTIL = [sys.executable, str(Path(__file__).parent / "fake_trainzutil.py")]
+
+
+def run(asset_dir: Path, assets: int, persistent: bool) -> float:
+    trainz_util = TrainzUtil(asset_dir, persistent=persistent, executable=FAKE_TRAINZUTIL)
+    start_time = time.perf_counter()
+
+    try:
+        for i in range(assets):
+            kuid = f"kuid:1:{i}"
+            trainz_util.delete_asset(kuid)
+            trainz_util.install_from_path(asset_dir)
+            trainz_util.commit_asset(kuid)
+    finally:
+        trainz_util.close()
+
+    return time.perf_counter() - start_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--assets", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as asset_dir:
+        asset_dir = Path(asset_dir)
+        (asset_dir / "config.txt").write_text("kuid <kuid:1:1>\n", encoding="utf-8")
+
+        for persistent in (False, True):
+            elapsed = run(asset_dir, args.assets, persistent)
+            print(f"persistent={str(persistent):<5} {elapsed:8.2f}s {args.assets / elapsed:8.1f} assets/s")
+
+
+if __name__ == "__main__":
+    main()
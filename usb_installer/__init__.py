@@ -1,5 +1,4 @@
 import sys
-import requests.utils
 
 from pathlib import Path
 from appdirs import user_data_dir
@@ -20,5 +19,14 @@ TEMPLATES_PATH = BASE_PATH / "templates"
 # Determine the path of the local app data folder
 USER_DATA_PATH = Path(user_data_dir("Installer", "U-Bahn Sim Berlin"))
 
-# Create user-agent string
-USER_AGENT = f"USBInstaller/{__version__} (+https://dl.u7-trainz.de) {requests.utils.default_user_agent()}"
+
+def __getattr__(name: str):
+    # Create user-agent string on first use, requests takes a while to import
+    if name == "USER_AGENT":
+        import requests.utils
+
+        global USER_AGENT
+        USER_AGENT = f"USBInstaller/{__version__} (+https://dl.u7-trainz.de) {requests.utils.default_user_agent()}"
+        return USER_AGENT
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
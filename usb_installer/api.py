@@ -1,23 +1,32 @@
 import os
 import json
+import threading
 
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger
 from pathlib import Path
-from typing import Any, Optional, Dict
-
-import psutil
-import requests
-import wmi
+from typing import TYPE_CHECKING, Any, Optional, Dict
 
 from webview import Window
-from webview.platforms.winforms import BrowserView
 
 from usb_installer import USER_DATA_PATH
+from usb_installer.assets import ASSETS_URL, diff_assets, fetch_assets
 from usb_installer.config import get_config
-from usb_installer.installer import AssetInstaller
+from usb_installer.probes import ProbeCache, detect_nvidia_gpu, fetch_installer_info
+from usb_installer.processes import process_watcher
 from usb_installer.trainz import find_trainz_install_path
 from usb_installer.winforms import show_message_box, show_folder_picker_dialog, MessageBoxButtons, MessageBoxIcon
 
+if TYPE_CHECKING:
+    from usb_installer.installer import AssetInstaller
+    from usb_installer.store import InstallState
+
 config_path = USER_DATA_PATH / "config.json"
+install_state_path = USER_DATA_PATH / "install.db"
+probe_cache_path = USER_DATA_PATH / "Cache" / "probes.json"
+
+# Get logger
+logger = getLogger(__name__)
 
 
 class InstallerAPI:
@@ -27,12 +36,51 @@ class InstallerAPI:
         if not USER_DATA_PATH.exists():
             USER_DATA_PATH.mkdir(parents=True)
 
-        if os.path.exists(USER_DATA_PATH / "assets.json"):
-            self._installed_assets = AssetInstaller.load_assets(USER_DATA_PATH / "assets.json")
-        else:
-            self._installed_assets = None
-
         self._config = get_config(config_path)
+        self._install_state_instance: Optional["InstallState"] = None
+        self._install_state_lock = threading.Lock()
+        self._probe_cache = ProbeCache(probe_cache_path)
+
+    @property
+    def _install_state(self) -> "InstallState":
+        # Opened on first use so SQLAlchemy isn't loaded before the window is shown
+        with self._install_state_lock:
+            if self._install_state_instance is None:
+                from usb_installer.store import InstallState
+
+                # Import the assets.json of older versions once
+                self._install_state_instance = InstallState(install_state_path)
+                self._install_state_instance.migrate_from_json(USER_DATA_PATH / "assets.json")
+
+            return self._install_state_instance
+
+    def _get_browser_view(self):
+        # Part of the GUI backend, which is only loaded once the window is shown
+        from webview.platforms.winforms import BrowserView
+
+        return BrowserView.instances.get(self._window.uid)
+
+    def _create_installer(self, install_path: Path, download_version: str) -> "AssetInstaller":
+        # The installer pulls in most dependencies, don't import it before an installation starts
+        from usb_installer.installer import AssetInstaller
+
+        return AssetInstaller(
+            self._window,
+            install_path,
+            download_version,
+            max_downloads=self._config.max_downloads,
+            downscale_textures=self._config.downscale_textures,
+            download_workers=self._config.download_workers,
+            max_cache_size=self._config.max_cache_size,
+            stage_workers=self._config.stage_workers,
+            texture_workers=self._config.texture_workers,
+            max_texture_cache_size=self._config.max_texture_cache_size,
+            install_state=self._install_state,
+            max_download_workers=self._config.max_download_workers,
+            max_temp_size=self._config.max_temp_size,
+            trace=self._config.trace,
+            persistent_trainzutil=self._config.persistent_trainzutil,
+        )
 
     def getConfig(self) -> Dict[str, Any]:
         return self._config.model_dump(mode="json", by_alias=True)
@@ -48,31 +96,46 @@ class InstallerAPI:
             return False
 
         # Check if the user has already installed
-        return self._installed_assets is not None
+        return self._install_state.get_last_revision() is not None
 
     def isInstallationAborted(self) -> bool:
-        # Check if the user has aborted the installation before (lock file exists)
-        return Path(USER_DATA_PATH / "assets.json.lock").exists()
+        # Check if the user has aborted the installation before
+        return self._install_state.is_install_in_progress()
 
     def isNvidiaGPU(self) -> bool:
-        # Create a WMI object
-        wmi_obj = wmi.WMI()
-
-        # Query WMI for GPU information
-        gpu_info = wmi_obj.Win32_VideoController()
-
-        # Check if user has an NVIDIA GPU
-        for gpu in gpu_info:
-            if "nvidia" in gpu.Description.lower():
-                return True
-
-        return False
+        # The WMI query takes a while, the result is cached until the next reboot
+        return self._probe_cache.get("nvidia_gpu", detect_nvidia_gpu)
+
+    def getStartupState(self) -> Dict[str, Any]:
+        # Probes and the value used if they fail
+        probes = {
+            "installerInfo": (fetch_installer_info, None),
+            "trainzRunning": (self.isTrainzRunning, False),
+            "nvidiaGPU": (self.isNvidiaGPU, False),
+            "installationAborted": (self.isInstallationAborted, False),
+            "installed": (self.isInstalled, None),
+        }
+
+        # Run all probes at once instead of one round-trip each
+        with ThreadPoolExecutor(max_workers=len(probes)) as executor:
+            futures = {name: executor.submit(probe) for name, (probe, _) in probes.items()}
+
+        state = {}
+
+        for name, future in futures.items():
+            try:
+                state[name] = future.result()
+            except Exception as e:
+                logger.error(f"Start-up probe {name} failed", exc_info=e)
+                state[name] = probes[name][1]
+
+        return state
 
     def findInstallPath(self) -> Optional[str]:
-        return find_trainz_install_path(check_user=False)
+        return find_trainz_install_path()
 
     def selectInstallPath(self, current_path) -> Optional[str]:
-        i = BrowserView.instances.get(self._window.uid)
+        i = self._get_browser_view()
         selected_path = show_folder_picker_dialog(initial_directory=current_path, window=i)
 
         # Do nothing if the user cancels the dialog
@@ -103,21 +166,14 @@ class InstallerAPI:
         process_names = ["trainz.exe", "contentmanager.exe", "launcher.exe"]
 
         # Check if Trainz.exe or ContentManager.exe is running
-        for proc in psutil.process_iter():
-            if proc.name().lower() in process_names:
-                return True
-
-        return False
+        return process_watcher.is_running(process_names)
 
     def checkForUpdates(self) -> Optional[int]:
-        try:
-            new_assets = AssetInstaller.get_assets(from_revision=self._installed_assets.last_revision)
-        except requests.HTTPError as e:
-            # Check if the server returned a 404 error
-            if e.response.status_code == 404:
-                return None
-            else:
-                raise e
+        new_assets = fetch_assets(ASSETS_URL, USER_DATA_PATH / "Cache" / "manifest")
+
+        # Only report an update if any asset has actually changed
+        if not diff_assets(self._install_state.get_installed_assets(), new_assets).to_install:
+            return None
 
         # Return new revision number
         return new_assets.last_revision
@@ -127,20 +183,26 @@ class InstallerAPI:
         self._config.download_version = download_version
         self._config.downscale_textures = additional_options.pop("downscaleTextures", False)
         self._config.max_downloads = additional_options.pop("maxDownloads", 0)
+        self._config.download_workers = additional_options.pop("downloadWorkers", self._config.download_workers)
 
         try:
             self.saveConfig()
         except Exception as e:
-            i = BrowserView.instances.get(self._window.uid)
+            i = self._get_browser_view()
             show_message_box(str(e), "Fehler", MessageBoxButtons.OK, MessageBoxIcon.ERROR, window=i)
             return
 
-        installer = AssetInstaller(self._window, Path(install_path), download_version, self._config.max_downloads, self._config.downscale_textures)
+        installer = self._create_installer(Path(install_path), download_version)
         installer.start(additional_options.pop("fromRevision", 0), additional_options)
 
     def startUpdate(self):
-        installer = AssetInstaller(self._window, self._config.install_path, self._config.download_version, self._config.max_downloads, self._config.downscale_textures)
-        installer.start(from_revision=self._installed_assets.last_revision)
+        installer = self._create_installer(self._config.install_path, self._config.download_version)
+        installer.start(installed_assets=self._install_state.get_installed_assets())
+
+    def resumeInstall(self):
+        # Continue with the assets that weren't installed before the installation was aborted
+        installer = self._create_installer(self._config.install_path, self._config.download_version)
+        installer.start(self._install_state.get_from_revision(), self._install_state.get_additional_options(), self._install_state.get_installed_assets())
 
     def openContentManager(self):
         # Open ContentManager.exe
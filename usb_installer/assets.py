@@ -0,0 +1,187 @@
+import hashlib
+import json
+import logging
+import threading
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import BaseModel, ValidationError, field_validator
+from pydantic.alias_generators import to_camel
+
+from usb_installer.trainz import Kuid
+
+__all__ = ["ASSETS_URL", "Asset", "AssetsResponse", "ManifestDiff", "diff_assets", "fetch_assets"]
+
+logger = logging.getLogger(__name__)
+
+
+def _accept_encoding() -> str:
+    # Brotli is only supported by requests if the module is installed
+    try:
+        import brotli
+    except ModuleNotFoundError:
+        return "gzip"
+
+    return "br, gzip"
+
+
+ACCEPT_ENCODING = _accept_encoding()
+
+# API endpoint for assets
+ASSETS_URL = "https://dl.u7-trainz.de/api/assets.json"
+
+# Location of the asset archives, one folder per download version
+ASSETS_BASE_URL = "https://dl.u7-trainz.de/assets-new"
+
+# Download version whose archives the manifest hashes describe
+HASHED_DOWNLOAD_VERSION = "full"
+
+
+class Asset(BaseModel):
+    username: str
+    kuid: Kuid
+    sha1: str
+    file_id: str
+    revision: int
+
+    class Config:
+        arbitrary_types_allowed = True
+        alias_generator = to_camel
+
+    @field_validator("kuid", mode="before")
+    def validate_kuid(cls, value: str) -> Kuid:
+        if isinstance(value, str):
+            return Kuid(value)
+
+        if isinstance(value, Kuid):
+            return value
+
+        raise TypeError("Kuid must be a string or Kuid object")
+
+    def get_url(self, download_version: str) -> str:
+        return f"{ASSETS_BASE_URL}/{download_version}/{self.file_id}_r{self.revision}.zip"
+
+    def get_sha1(self, download_version: str) -> Optional[str]:
+        # There is only one hash per asset, the archives of other versions can't be checked against it
+        return self.sha1 if download_version == HASHED_DOWNLOAD_VERSION else None
+
+
+class AssetsResponse(BaseModel):
+    assets: List[Asset]
+    last_revision: int
+
+    class Config:
+        alias_generator = to_camel
+
+
+@dataclass
+class ManifestDiff:
+    added: List[Asset] = field(default_factory=list)
+    changed: List[Asset] = field(default_factory=list)
+    unchanged: List[Asset] = field(default_factory=list)
+    removed: List[Asset] = field(default_factory=list)
+
+    @property
+    def to_install(self) -> List[Asset]:
+        return self.added + self.changed
+
+    def __bool__(self):
+        return bool(self.added or self.changed or self.removed)
+
+
+def diff_assets(installed: Optional[AssetsResponse], remote: AssetsResponse) -> ManifestDiff:
+    installed_by_kuid: Dict[Kuid, Asset] = {asset.kuid: asset for asset in installed.assets} if installed is not None else {}
+    manifest_diff = ManifestDiff()
+
+    # Compare every remote asset against the installed one with the same KUID
+    for asset in remote.assets:
+        installed_asset = installed_by_kuid.pop(asset.kuid, None)
+
+        if installed_asset is None:
+            manifest_diff.added.append(asset)
+        elif installed_asset.revision != asset.revision or installed_asset.sha1 != asset.sha1:
+            manifest_diff.changed.append(asset)
+        else:
+            manifest_diff.unchanged.append(asset)
+
+    # Whatever is left is no longer part of the manifest
+    manifest_diff.removed.extend(installed_by_kuid.values())
+
+    return manifest_diff
+
+
+# Parsed manifests of this process by URL, together with their validator
+_manifest_cache: Dict[str, Tuple[str, "AssetsResponse"]] = {}
+_manifest_lock = threading.Lock()
+
+
+def fetch_assets(url: str, cache_dir: Path, timeout: float = 60) -> AssetsResponse:
+    # Imported here as they take a while and aren't needed before the first request
+    import requests
+
+    from usb_installer import USER_AGENT
+
+    cache_file = cache_dir / f"{hashlib.sha1(url.encode()).hexdigest()}.json"
+    meta_file = cache_file.with_suffix(".meta.json")
+    headers = {"User-Agent": USER_AGENT, "Accept-Encoding": ACCEPT_ENCODING}
+    meta = {}
+
+    # Ask the server to only send the manifest if it has changed
+    if cache_file.exists():
+        try:
+            with open(meta_file, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = {}
+
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    r = requests.get(url, headers=headers, timeout=timeout)
+    validator = meta.get("etag") or meta.get("last_modified") or ""
+
+    if r.status_code == 304 and meta:
+        logger.info(f"Manifest {url} not modified")
+
+        with _manifest_lock:
+            cached = _manifest_cache.get(url)
+
+        if cached is not None and cached[0] == validator:
+            return cached[1]
+
+        try:
+            with open(cache_file, "rb") as f:
+                assets_json = AssetsResponse.model_validate_json(f.read())
+        except (OSError, ValidationError) as e:
+            # Without the cached manifest the validator is worthless, fetch it again in full
+            logger.warning(f"Cached manifest {cache_file} is unusable", exc_info=e)
+            meta_file.unlink(missing_ok=True)
+            cache_file.unlink(missing_ok=True)
+            return fetch_assets(url, cache_dir, timeout)
+    else:
+        r.raise_for_status()
+        logger.info(f"Downloaded manifest {url} ({r.headers.get('content-length', len(r.content))} bytes, {r.headers.get('content-encoding', 'identity')})")
+
+        # Parse the JSON response
+        assets_json = AssetsResponse.model_validate_json(r.content)
+        validator = r.headers.get("etag") or r.headers.get("last-modified") or ""
+
+        # Only keep manifests that can be validated later on
+        if validator:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            temp_file = cache_file.with_suffix(".tmp")
+            temp_file.write_bytes(r.content)
+            temp_file.replace(cache_file)
+
+            with open(meta_file, "w", encoding="utf-8") as f:
+                json.dump({"etag": r.headers.get("etag"), "last_modified": r.headers.get("last-modified")}, f)
+
+    with _manifest_lock:
+        _manifest_cache[url] = (validator, assets_json)
+
+    return assets_json
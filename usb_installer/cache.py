@@ -0,0 +1,139 @@
+import logging
+import os
+import shutil
+import threading
+import uuid
+
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["FileCache"]
+
+
+class FileCache:
+    """Content-addressed file cache with a size cap and LRU eviction.
+
+    Entries are only ever inserted by renaming a finished temporary file into place and their
+    access time is tracked through the file mtime, so several installer instances can share
+    the same cache directory without any additional locking.
+    """
+
+    def __init__(self, cache_dir: Path, max_size: int):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._total_size: Optional[int] = None
+
+        if not cache_dir.exists():
+            cache_dir.mkdir(parents=True)
+
+    def __getstate__(self):
+        # Allow passing the cache to worker processes
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / key
+
+    def _entries(self):
+        for entry in self.cache_dir.glob("*/*"):
+            # Skip unfinished inserts from other instances
+            if entry.name.startswith("."):
+                continue
+
+            try:
+                yield entry, entry.stat()
+            except FileNotFoundError:
+                continue
+
+    @property
+    def total_size(self) -> int:
+        with self._lock:
+            if self._total_size is None:
+                self._total_size = sum(stat.st_size for _, stat in self._entries())
+
+            return self._total_size
+
+    def get(self, key: str) -> Optional[Path]:
+        path = self._path(key)
+
+        try:
+            # Mark the entry as recently used
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+
+        return path
+
+    def fetch(self, key: str, destination: Path) -> bool:
+        path = self.get(key)
+
+        if path is None:
+            return False
+
+        temp_destination = destination.with_name(f".{destination.name}.{uuid.uuid4().hex}.tmp")
+
+        try:
+            _link_or_copy(path, temp_destination)
+        except FileNotFoundError:
+            # Evicted by another instance in the meantime
+            return False
+
+        temp_destination.replace(destination)
+        return True
+
+    def put(self, key: str, file_path: Path):
+        if self.max_size <= 0:
+            return
+
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+
+        # Insert atomically, readers never see a partially written entry
+        temp_path = path.with_name(f".{key}.{uuid.uuid4().hex}.tmp")
+        _link_or_copy(file_path, temp_path)
+        temp_path.replace(path)
+
+        with self._lock:
+            if self._total_size is None:
+                self._total_size = sum(stat.st_size for _, stat in self._entries())
+            else:
+                self._total_size += path.stat().st_size
+
+            if self._total_size > self.max_size:
+                self._evict()
+
+    def _evict(self):
+        entries = sorted(self._entries(), key=lambda entry: entry[1].st_mtime)
+        total_size = sum(stat.st_size for _, stat in entries)
+
+        for entry, stat in entries:
+            if total_size <= self.max_size:
+                break
+
+            entry.unlink(missing_ok=True)
+            total_size -= stat.st_size
+            logger.info(f"Evicted {entry.name} from cache")
+
+        self._total_size = total_size
+
+    def clear(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+        with self._lock:
+            self._total_size = 0
+
+
+def _link_or_copy(source: Path, destination: Path):
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
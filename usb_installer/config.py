@@ -2,7 +2,7 @@ import enum
 import json
 
 from pathlib import Path
-from typing import Any, Optional
+from typing import Any, Dict, Optional
 
 from pydantic import BaseModel, ValidationError, field_validator
 from pydantic.alias_generators import to_camel
@@ -18,7 +18,16 @@ class Config(BaseModel):
     install_path: Optional[Path] = None
     download_version: DownloadVersion = DownloadVersion.FULL
     downscale_textures: bool = False
+    texture_workers: int = 0
     max_downloads: int = 0
+    download_workers: int = 4
+    max_download_workers: int = 16
+    max_temp_size: int = 0
+    trace: bool = False
+    persistent_trainzutil: bool = False
+    max_cache_size: int = 0
+    max_texture_cache_size: int = 0
+    stage_workers: Dict[str, int] = {}
 
     class Config:
         alias_generator = to_camel
@@ -1 +1,3 @@
-from .client import DownloadClient
+from .budget import ByteBudget
+from .client import DownloadClient, DownloadVerificationError
+from .concurrency import ConcurrencyController
@@ -0,0 +1,54 @@
+import threading
+
+from typing import Dict
+
+__all__ = ["ByteBudget"]
+
+
+class ByteBudget:
+    """Limits the bytes of downloaded files waiting on disk until they are consumed.
+
+    Downloads reserve their expected size under the path of their file before they start and the
+    consumer releases the reservation once the file has been deleted. A download larger than the
+    whole budget is still let through when nothing else is reserved, so it can never block forever.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.used_bytes = 0
+        self.closed = False
+        self._reservations: Dict[str, int] = {}
+        self._condition = threading.Condition()
+
+    def acquire(self, key: str, size: int) -> bool:
+        with self._condition:
+            while not self.closed and self.used_bytes > 0 and self.used_bytes + size > self.max_bytes:
+                self._condition.wait()
+
+            if self.closed:
+                return False
+
+            self.used_bytes += size - self._reservations.get(key, 0)
+            self._reservations[key] = size
+            return True
+
+    def resize(self, key: str, size: int):
+        # Replace the expected size with the actual one once it is known, without waiting
+        with self._condition:
+            if key not in self._reservations:
+                return
+
+            self.used_bytes += size - self._reservations[key]
+            self._reservations[key] = size
+            self._condition.notify_all()
+
+    def release(self, key: str):
+        with self._condition:
+            self.used_bytes -= self._reservations.pop(key, 0)
+            self._condition.notify_all()
+
+    def close(self):
+        # Wake up every waiting download, e.g. when the installation is cancelled
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
@@ -1,18 +1,41 @@
+import hashlib
+import json
 import logging
-import time
+import queue
+import re
 import threading
+import time
+import zipfile
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 
 from pathlib import Path
 from urllib.parse import urlparse, unquote
-from typing import List, Callable
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import requests
 
+from requests.adapters import HTTPAdapter
+
 from usb_installer import USER_AGENT
+from usb_installer.cache import FileCache
+from usb_installer.downloader.budget import ByteBudget
+from usb_installer.downloader.concurrency import ConcurrencyController
+from usb_installer.meter import ThroughputMeter
+from usb_installer.tracing import span
 from usb_installer.utils import readable_size
 
 logger = logging.getLogger(__name__)
 
+CONTENT_RANGE_PATTERN = re.compile(r"^bytes (\d+)-(\d+)/(\d+)$")
+
+
+class DownloadVerificationError(Exception):
+    def __init__(self, url: str, message: str):
+        super().__init__(f"{message}: {url}")
+        self.url = url
+
 
 class DownloadClient:
     def __init__(
@@ -22,17 +45,46 @@ class DownloadClient:
         completion_callback: Callable[[str, Path], None],
         error_callback: Callable[[str, Exception], None],
         max_retries: int = 5,
+        max_workers: int = 1,
+        cache: Optional[FileCache] = None,
+        cache_keys: Optional[Dict[str, str]] = None,
+        checksums: Optional[Dict[str, str]] = None,
+        controller: Optional[ConcurrencyController] = None,
+        sizes: Optional[Dict[str, int]] = None,
+        budget: Optional[ByteBudget] = None,
     ):
         self.urls = urls
         self.download_dir = download_dir
         self.completion_callback = completion_callback
         self.error_callback = error_callback
         self.max_retries = max_retries
+        self.controller = controller
+        self.sizes = sizes if sizes is not None else {}
+        self.budget = budget
+
+        # The controller decides how many of the workers may download at the same time
+        self.max_workers = controller.max_limit if controller is not None else max(1, max_workers)
+        self.cache = cache
+        self.cache_keys = cache_keys or {}
+        self.checksums = checksums or {}
         self.download_thread = threading.Thread(target=self._download_urls)
+        self.worker_threads: List[threading.Thread] = []
         self.stop_download = False
-        self.current_speed = 0.0
-        self.progress = 0.0
         self.downloaded_count = 0
+        self.downloaded_bytes = 0
+        self.completed_size = 0
+        self.cached_count = 0
+
+        # Bytes received by all workers
+        self.meter = ThroughputMeter()
+
+        # Per-worker state, aggregated by the properties below
+        self._lock = threading.Lock()
+        self._callback_lock = threading.Lock()
+        self._worker_progress: Dict[int, float] = {}
+
+        # Running total of the known sizes, updated together with them
+        self._total_size = sum(self.sizes.values())
 
         if not download_dir.exists():
             download_dir.mkdir(parents=True)
@@ -41,71 +93,359 @@ class DownloadClient:
     def total_count(self) -> int:
         return len(self.urls)
 
-    def _download_url(self, url: str, session: requests.Session):
-        local_filename = self.download_dir / unquote(urlparse(url).path.split("/")[-1])
+    @property
+    def current_speed(self) -> float:
+        return self.meter.rate()
+
+    @property
+    def average_file_size(self) -> Optional[float]:
+        with self._lock:
+            return self.completed_size / self.downloaded_count if self.downloaded_count > 0 else None
+
+    @property
+    def progress(self) -> float:
+        with self._lock:
+            if not self._worker_progress:
+                return 0.0
+
+            return sum(self._worker_progress.values()) / len(self._worker_progress)
+
+    def _set_worker_progress(self, progress: float):
+        worker_id = threading.get_ident()
+
+        with self._lock:
+            self._worker_progress[worker_id] = progress
+
+    @staticmethod
+    def _load_resume_info(meta_filename: Path) -> Optional[Dict[str, Any]]:
+        try:
+            with open(meta_filename, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _save_resume_info(meta_filename: Path, r: requests.Response, total_size: int):
+        resume_info = {
+            "etag": r.headers.get("etag"),
+            "last_modified": r.headers.get("last-modified"),
+            "total_size": total_size,
+        }
+
+        with open(meta_filename, "w", encoding="utf-8") as f:
+            json.dump(resume_info, f)
+
+    @staticmethod
+    def _parse_content_range(value: str) -> Optional[Tuple[int, int]]:
+        # Content-Range: bytes <start>-<end>/<total>
+        match = CONTENT_RANGE_PATTERN.match(value or "")
+
+        if not match:
+            return None
+
+        return int(match.group(1)), int(match.group(3))
+
+    def get_local_filename(self, url: str) -> Path:
+        return self.download_dir / unquote(urlparse(url).path.split("/")[-1])
+
+    def _expected_size(self, url: str) -> int:
+        with self._lock:
+            if url in self.sizes:
+                return self.sizes[url]
+
+            # Assume files of unknown size are of average size
+            return self._total_size // len(self.sizes) if self.sizes else 0
+
+    def _update_size(self, url: str, local_filename: Path, size: int):
+        if size <= 0:
+            return
+
+        # Sizes are only known up front for a sample of the files, the rest is learned from the downloads
+        with self._lock:
+            self._total_size += size - self.sizes.get(url, 0)
+            self.sizes[url] = size
+
+        if self.budget is not None:
+            self.budget.resize(str(local_filename), size)
+
+    @staticmethod
+    def fetch_sizes(urls: List[str], max_workers: int = 8) -> Dict[str, int]:
+        sizes = {}
+
+        with requests.Session() as session:
+            session.headers["User-Agent"] = USER_AGENT
+
+            def fetch_size(url: str) -> Optional[int]:
+                try:
+                    r = session.head(url, timeout=30, allow_redirects=True)
+                    r.raise_for_status()
+                except requests.RequestException as e:
+                    logger.warning(f"Failed to get size of {url}", exc_info=e)
+                    return None
+
+                content_length = r.headers.get("content-length")
+                return int(content_length) if content_length is not None and content_length.isdigit() else None
+
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                for url, size in zip(urls, executor.map(fetch_size, urls)):
+                    if size is not None:
+                        sizes[url] = size
+
+        return sizes
+
+    def _download_url(self, url: str, session: requests.Session) -> bool:
+        local_filename = self.get_local_filename(url)
         temp_filename = local_filename.with_suffix(local_filename.suffix + ".part")
+        meta_filename = local_filename.with_suffix(local_filename.suffix + ".part.json")
+        cache_key = self.cache_keys.get(url)
+
+        # Skip the network entirely if the file is already cached
+        if self.cache is not None and cache_key is not None and self.cache.fetch(cache_key, local_filename):
+            logger.info(f"Using cached file for {url}")
+
+            with self._lock:
+                self.cached_count += 1
+
+            self._finish_download(url, None, None, local_filename, 0)
+            return True
+
         logger.info(f"Downloading {url} to {local_filename}")
 
         retries = 0
+        finished = False
 
         while retries < self.max_retries and not self.stop_download:
-            self.progress = 0.0
-            self.current_speed = 0.0
+            self._set_worker_progress(0.0)
+
+            # Try to resume a partial download left by a previous attempt or run
+            headers = {}
+            resume_from = temp_filename.stat().st_size if temp_filename.exists() else 0
+            resume_info = self._load_resume_info(meta_filename) if resume_from > 0 else None
+
+            if resume_info is not None:
+                headers["Range"] = f"bytes={resume_from}-"
+
+                # Only accept the range if the file on the server hasn't changed
+                validator = resume_info.get("etag") or resume_info.get("last_modified")
+                if validator:
+                    headers["If-Range"] = validator
+            else:
+                resume_from = 0
+
+            start_time = time.monotonic()
 
             try:
-                with session.get(url, timeout=60, stream=True) as r:
+                with session.get(url, headers=headers, timeout=60, stream=True) as r:
+                    self._record_response(time.monotonic() - start_time, r.status_code >= 500)
+
+                    if r.status_code == 416 and resume_info is not None:
+                        # The partial file may already be complete
+                        if resume_from == resume_info.get("total_size"):
+                            logger.info(f"Partial download of {url} is already complete")
+                            self._finish_download(url, temp_filename, meta_filename, local_filename, 0)
+                            finished = True
+                            break
+
+                        logger.warning(f"Server rejected range for {url}, restarting download")
+                        temp_filename.unlink(missing_ok=True)
+                        meta_filename.unlink(missing_ok=True)
+                        continue
+
                     r.raise_for_status()
 
-                    total_size_in_bytes = int(r.headers.get("content-length", 0))
+                    content_length = int(r.headers.get("content-length", 0))
+                    content_range = self._parse_content_range(r.headers.get("content-range"))
+
+                    if r.status_code == 206 and resume_info is not None:
+                        # Make sure the server continues exactly where we stopped
+                        if content_range is None or content_range[0] != resume_from or content_range[1] != resume_info.get("total_size"):
+                            logger.warning(f"Unexpected content range for {url}, restarting download")
+                            temp_filename.unlink(missing_ok=True)
+                            meta_filename.unlink(missing_ok=True)
+                            continue
+
+                        total_size_in_bytes = content_range[1]
+                        downloaded_size = resume_from
+                        file_mode = "ab"
+                        logger.info(f"Resuming download at {readable_size(resume_from)} of {readable_size(total_size_in_bytes)}")
+                    else:
+                        # Server ignored the range or the file has changed, start from scratch
+                        total_size_in_bytes = content_length
+                        downloaded_size = 0
+                        file_mode = "wb"
+                        self._save_resume_info(meta_filename, r, total_size_in_bytes)
+                        logger.info(f"Total size: {readable_size(total_size_in_bytes)}")
+
+                    self._update_size(url, local_filename, total_size_in_bytes)
+
                     chunk_size = 4096
-                    downloaded_size = 0
-                    logger.info(f"Total size: {readable_size(total_size_in_bytes)}")
+                    received_size = 0
 
-                    # Start time for calculating speed
-                    start_time = time.time()
+                    # Hash the file while it is streamed, including any resumed part
+                    sha1 = self._hash_file(temp_filename) if file_mode == "ab" else hashlib.sha1()
 
-                    with open(temp_filename, 'wb') as f:
+                    with open(temp_filename, file_mode) as f:
                         for data in r.iter_content(chunk_size):
                             if self.stop_download:
                                 logger.info("Download stopped by user")
-                                return  # Stop the download
+                                return False  # Stop the download
 
                             f.write(data)
+                            sha1.update(data)
                             downloaded_size += len(data)
-                            self.progress = (downloaded_size / total_size_in_bytes) * 100
+                            received_size += len(data)
+                            self.meter.add(len(data))
+                            self._set_worker_progress((downloaded_size / total_size_in_bytes) * 100 if total_size_in_bytes > 0 else 0.0)
 
-                            # Calculate elapsed time and speed
-                            elapsed_time = time.time() - start_time
-                            self.current_speed = downloaded_size / elapsed_time if elapsed_time > 0 else 0
+                self._verify_download(url, temp_filename, sha1.hexdigest())
+                self._finish_download(url, temp_filename, meta_filename, local_filename, received_size)
+                finished = True
+                break  # Break the loop if download is successful
+            except DownloadVerificationError as e:
+                retries += 1
+                logger.error(f"Verification of {url} failed. Attempt {retries} of {self.max_retries}", exc_info=e)
 
-                # Rename the file
-                temp_filename.replace(local_filename)
-                logger.info(f"Finished downloading {url}")
+                # Never resume from a corrupted file
+                temp_filename.unlink(missing_ok=True)
+                meta_filename.unlink(missing_ok=True)
 
-                self.downloaded_count += 1
-                self.completion_callback(url, local_filename)
-                break  # Break the loop if download is successful
+                if retries >= self.max_retries:
+                    with self._callback_lock:
+                        self.error_callback(url, e)
             except requests.RequestException as e:
+                if e.response is None:
+                    self._record_response(None, True)
+
                 retries += 1
                 logger.error(f"Error downloading {url}. Attempt {retries} of {self.max_retries}", exc_info=e)
                 if retries >= self.max_retries:
-                    self.error_callback(url, e)
+                    with self._callback_lock:
+                        self.error_callback(url, e)
             except Exception as e:
                 logger.error(f"Error downloading {url}", exc_info=e)
-                self.error_callback(url, e)
+                with self._callback_lock:
+                    self.error_callback(url, e)
+                break
+
+        self._set_worker_progress(0.0)
+        return finished
+
+    def _record_response(self, latency: Optional[float], error: bool):
+        if self.controller is not None:
+            self.controller.record(latency, error)
+
+    @staticmethod
+    def _hash_file(file_path: Path) -> Any:
+        sha1 = hashlib.sha1()
+
+        with open(file_path, "rb") as f:
+            while data := f.read(1024 * 1024):
+                sha1.update(data)
+
+        return sha1
+
+    def _verify_download(self, url: str, temp_filename: Path, digest: str):
+        expected_digest = self.checksums.get(url)
+
+        if expected_digest is not None and digest != expected_digest.lower():
+            raise DownloadVerificationError(url, f"SHA-1 mismatch (expected {expected_digest}, got {digest})")
+
+        # Check the central directory and CRCs before the file reaches the installer
+        try:
+            with span("verify", "download", file=temp_filename.name), zipfile.ZipFile(temp_filename, "r") as zf:
+                bad_file = zf.testzip()
+        except zipfile.BadZipFile as e:
+            raise DownloadVerificationError(url, f"Invalid zip file ({e})") from e
+
+        if bad_file is not None:
+            raise DownloadVerificationError(url, f"CRC mismatch in {bad_file}")
+
+    def _finish_download(self, url: str, temp_filename: Optional[Path], meta_filename: Optional[Path], local_filename: Path, received_size: int):
+        if temp_filename is not None:
+            # Rename the file
+            temp_filename.replace(local_filename)
+            meta_filename.unlink(missing_ok=True)
+            logger.info(f"Finished downloading {url}")
+
+            # Keep a copy in the cache for later installs
+            cache_key = self.cache_keys.get(url)
+            if self.cache is not None and cache_key is not None:
+                try:
+                    self.cache.put(cache_key, local_filename)
+                except OSError as e:
+                    logger.warning(f"Failed to cache {url}", exc_info=e)
+
+        file_size = local_filename.stat().st_size
+
+        with self._lock:
+            self.downloaded_count += 1
+            self.downloaded_bytes += received_size
+            self.completed_size += file_size
+
+        # Serialize callbacks so consumers never see concurrent calls
+        with self._callback_lock:
+            self.completion_callback(url, local_filename)
+
+    def _run_worker(self, url_queue: queue.Queue, session: requests.Session):
+        while not self.stop_download:
+            try:
+                url = url_queue.get_nowait()
+            except queue.Empty:
                 break
 
+            with self.controller.slot() if self.controller is not None else nullcontext():
+                # The client may have been stopped while waiting for a slot
+                if self.stop_download:
+                    break
+
+                budget_key = str(self.get_local_filename(url))
+                finished = False
+
+                try:
+                    # Wait until enough of the files on disk have been consumed
+                    if self.budget is not None and not self.budget.acquire(budget_key, self._expected_size(url)):
+                        break
+
+                    with span("download", "download", file=Path(budget_key).name) as download_span:
+                        finished = self._download_url(url, session)
+                        download_span.set(finished=finished, bytes=self.sizes.get(url, 0))
+                finally:
+                    # Finished files are released by their consumer, all others right away
+                    if not finished and self.budget is not None:
+                        self.budget.release(budget_key)
+
+        # Remove the worker from the aggregated state
+        with self._lock:
+            self._worker_progress.pop(threading.get_ident(), None)
+
     def _download_urls(self):
-        logger.info(f"Starting download of {self.total_count} URLs")
+        logger.info(f"Starting download of {self.total_count} URLs with {self.max_workers} workers")
+
+        url_queue = queue.Queue()
+
+        for url in self.urls:
+            url_queue.put(url)
 
         with requests.Session() as session:
             session.headers["User-Agent"] = USER_AGENT
 
-            for url in self.urls:
-                if self.stop_download:
-                    break
+            # Allow one pooled connection per worker
+            adapter = HTTPAdapter(pool_connections=self.max_workers, pool_maxsize=self.max_workers)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
 
-                self._download_url(url, session)
+            self.worker_threads = [threading.Thread(target=self._run_worker, args=(url_queue, session), name=f"DownloadWorker-{i}") for i in range(self.max_workers)]
+
+            for worker in self.worker_threads:
+                worker.start()
+
+            for worker in self.worker_threads:
+                while worker.is_alive():
+                    worker.join(timeout=0.5)
+
+                    # Adjust the number of in-flight downloads to the measured throughput
+                    if self.controller is not None:
+                        self.controller.update(self.meter.total_bytes)
 
         logger.info("Finished downloading URLs")
 
@@ -117,7 +457,14 @@ class DownloadClient:
 
     def stop(self):
         self.stop_download = True
-        self.download_thread.join()
+
+        if self.budget is not None:
+            self.budget.close()
+
+        # Callbacks may stop the client from within one of its own threads
+        current_thread = threading.current_thread()
+        if current_thread is not self.download_thread and current_thread not in self.worker_threads:
+            self.download_thread.join()
 
     def is_running(self):
         return self.download_thread.is_alive()
@@ -0,0 +1,121 @@
+import logging
+import threading
+import time
+
+from contextlib import contextmanager
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["ConcurrencyController"]
+
+
+class ConcurrencyController:
+    """AIMD controller for the number of in-flight downloads.
+
+    Every interval the limit grows by one as long as throughput keeps improving, and is halved
+    as soon as the error rate or the response latency indicate that the connection is congested.
+    """
+
+    def __init__(
+        self,
+        initial_limit: int,
+        min_limit: int = 1,
+        max_limit: int = 16,
+        interval: float = 2.0,
+        max_error_rate: float = 0.1,
+        latency_factor: float = 2.0,
+        min_gain: float = 0.05,
+    ):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = min(max(initial_limit, self.min_limit), self.max_limit)
+        self.interval = interval
+        self.max_error_rate = max_error_rate
+        self.latency_factor = latency_factor
+        self.min_gain = min_gain
+        self.in_flight = 0
+        self._condition = threading.Condition()
+
+        # Samples of the current interval
+        self._requests = 0
+        self._errors = 0
+        self._latency_sum = 0.0
+
+        # Reference values of earlier intervals
+        self._base_latency: Optional[float] = None
+        self._last_throughput = 0.0
+        self._last_bytes = 0
+        self._last_update = time.monotonic()
+
+    @contextmanager
+    def slot(self):
+        with self._condition:
+            while self.in_flight >= self.limit:
+                self._condition.wait()
+
+            self.in_flight += 1
+
+        try:
+            yield
+        finally:
+            with self._condition:
+                self.in_flight -= 1
+                self._condition.notify()
+
+    def record(self, latency: Optional[float], error: bool = False):
+        with self._condition:
+            self._requests += 1
+
+            if error:
+                self._errors += 1
+            elif latency is not None:
+                self._latency_sum += latency
+
+    def update(self, total_bytes: int) -> bool:
+        now = time.monotonic()
+
+        with self._condition:
+            if now - self._last_update < self.interval or self._requests == 0:
+                return False
+
+            # Throughput of this interval only, so the reaction to the last change is visible right away
+            throughput = (total_bytes - self._last_bytes) / (now - self._last_update)
+
+            successful = self._requests - self._errors
+            error_rate = self._errors / self._requests
+            latency = self._latency_sum / successful if successful > 0 else None
+            old_limit = self.limit
+
+            if latency is not None:
+                # The lowest latency seen so far is the one of an uncongested connection
+                self._base_latency = latency if self._base_latency is None else min(self._base_latency, latency)
+
+            if error_rate > self.max_error_rate:
+                reason = f"error rate {error_rate:.0%}"
+                self.limit = max(self.min_limit, self.limit // 2)
+            elif latency is not None and latency > self._base_latency * self.latency_factor:
+                reason = f"latency {latency * 1000:.0f} ms (base {self._base_latency * 1000:.0f} ms)"
+                self.limit = max(self.min_limit, self.limit // 2)
+            elif throughput >= self._last_throughput * (1 + self.min_gain):
+                reason = f"throughput {throughput / 1024 ** 2:.2f} MB/s"
+                self.limit = min(self.max_limit, self.limit + 1)
+            else:
+                reason = f"throughput {throughput / 1024 ** 2:.2f} MB/s not improving"
+
+            self._requests = 0
+            self._errors = 0
+            self._latency_sum = 0.0
+            self._last_throughput = throughput
+            self._last_bytes = total_bytes
+            self._last_update = now
+
+            # Let waiting workers pick up the new slots
+            self._condition.notify_all()
+
+        if self.limit != old_limit:
+            logger.info(f"Download concurrency {old_limit} -> {self.limit}: {reason}")
+        else:
+            logger.debug(f"Download concurrency stays at {self.limit}: {reason}")
+
+        return self.limit != old_limit
@@ -1,15 +1,16 @@
 import errno
-import io
 import json
+import os
 import shutil
 import subprocess
 import time
 import random
 import tempfile
 import threading
-import queue
 import zipfile
 
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 from logging import getLogger
 from pathlib import Path
 from typing import Any, Dict, List, Optional
@@ -17,114 +18,323 @@ from typing import Any, Dict, List, Optional
 import psutil
 import requests
 
-from PIL import Image
-from pydantic import BaseModel, field_validator
-from pydantic.alias_generators import to_camel
+from pydantic import ValidationError
 from webview import Window
 
 from usb_installer import USER_DATA_PATH, USER_AGENT, BASE_PATH, TEMPLATES_PATH
-from usb_installer.downloader import DownloadClient
+from usb_installer.assets import ASSETS_URL, Asset, AssetsResponse, diff_assets, fetch_assets
+from usb_installer.cache import FileCache
+from usb_installer.meter import ThroughputMeter
+from usb_installer.downloader import ByteBudget, ConcurrencyController, DownloadClient, DownloadVerificationError
+from usb_installer.pipeline import Pipeline
+from usb_installer.processes import process_watcher
+from usb_installer.progress import InstallStats, ProgressBus
+from usb_installer.scheduling import DEFAULT_DOWNLOAD_RATE, InstallTimeModel, ScheduledAsset, estimate_makespan, schedule_downloads
+from usb_installer.store import AssetStatus, InstallState
+from usb_installer.textures import downscale_textures
+from usb_installer.tracing import span, tracer
 from usb_installer.trainz import Kuid, TrainzConfig, TrainzError, TrainzUtil, close_trainz_database, patcher
-from usb_installer.utils import fullname, format_speed
+from usb_installer.utils import fullname, format_duration, format_speed, readable_size
 from usb_installer.winforms import TaskbarProgressState, set_taskbar_progress
 
-# API endpoint for assets
-ASSETS_URL = "https://dl.u7-trainz.de/api/assets.json"
-
 # Kuid stub for scripts
 SCRIPTS_KUID = Kuid("kuid:1041339:100113")
 
-# Get logger
-logger = getLogger(__name__)
+# Default number of workers per pipeline stage
+DEFAULT_STAGE_WORKERS = {
+    "extract": 2,
+    "downscale": 1,
+    "config": 2,
+    "install": 1,
+    "commit": 1,
+}
+
+# Maximum number of assets waiting in front of each stage after extraction
+STAGE_QUEUE_SIZE = 4
 
+# Rough ratio between the size of the installed assets and their archives
+INSTALL_SIZE_FACTOR = 2.5
 
-class Asset(BaseModel):
-    username: str
-    kuid: Kuid
-    sha1: str
-    file_id: str
-    revision: int
+# Free space left untouched on every volume
+DISK_SPACE_RESERVE = 512 * 1024 ** 2
 
-    class Config:
-        arbitrary_types_allowed = True
-        alias_generator = to_camel
+# Number of uncached files whose size is requested up front, the others are extrapolated
+SIZE_SAMPLE_COUNT = 32
 
-    @field_validator("kuid", mode="before")
-    def validate_kuid(cls, value: str) -> Kuid:
-        if isinstance(value, str):
-            return Kuid(value)
+# Pauses in seconds before the installation starts and before it is finished
+START_DELAY = (2, 5)
+FINISH_DELAY = (5, 10)
+
+# Get logger
+logger = getLogger(__name__)
 
-        if isinstance(value, Kuid):
-            return value
 
-        raise TypeError("Kuid must be a string or Kuid object")
+@dataclass
+class InstallJob:
+    file_path: Path
+    asset: Optional[Asset] = None
+    temp_dir: Optional[Path] = None
+    config: Optional[TrainzConfig] = None
+    size: int = 0
+    install_time: float = 0.0
 
-    def get_url(self, download_version: str) -> str:
-        return f"https://dl.u7-trainz.de/assets-new/{download_version}/{self.file_id}_r{self.revision}.zip"
+    @property
+    def kuid(self) -> Optional[Kuid]:
+        if self.config is not None:
+            return self.config.kuid
 
+        return self.asset.kuid if self.asset is not None else None
 
-class AssetsResponse(BaseModel):
-    assets: List[Asset]
-    last_revision: int
+    def cleanup(self):
+        if self.temp_dir is not None:
+            shutil.rmtree(self.temp_dir, ignore_errors=True)
+            self.temp_dir = None
 
-    class Config:
-        alias_generator = to_camel
+        self.file_path.unlink(missing_ok=True)
 
 
 class AssetInstaller:
-    def __init__(self, window: Window, install_path: Path, download_version: str, max_downloads: int = 0, downscale_textures: bool = False):
+    def __init__(self, window: Window, install_path: Path, download_version: str, *, max_downloads: int = 0, downscale_textures: bool = False, download_workers: int = 1, max_cache_size: int = 0, stage_workers: Optional[Dict[str, int]] = None, texture_workers: int = 0, max_texture_cache_size: int = 0, install_state: Optional[InstallState] = None, max_download_workers: int = 0, max_temp_size: int = 0, trace: bool = False, persistent_trainzutil: bool = False):
         self.window = window
         self.install_path = install_path
         self.download_version = download_version
         self.max_downloads = max_downloads
+        self.download_workers = download_workers
+        self.max_download_workers = max_download_workers
+        self.max_temp_size = max_temp_size
+        self.trace = trace
+        self.download_sizes: Dict[str, int] = {}
+        self.cached_urls = set()
+        self.predicted_install_times: Dict[str, float] = {}
+        self._predicted_done = 0.0
+        self._measured_done = 0.0
+        self._history_lock = threading.Lock()
+        self.download_budget: Optional[ByteBudget] = None
+        self.cache = FileCache(USER_DATA_PATH / "Cache" / "assets", max_cache_size) if max_cache_size > 0 else None
+        self.texture_cache = FileCache(USER_DATA_PATH / "Cache" / "textures", max_texture_cache_size) if max_texture_cache_size > 0 else None
         self.downscale_textures = downscale_textures
+        self.texture_workers = texture_workers
+        self.texture_executor = ProcessPoolExecutor(max_workers=texture_workers or None) if downscale_textures else None
         self.download_client = None
-        self.trainz_util = TrainzUtil(install_path, timeout=15*60)
+        self.install_state = install_state or InstallState(USER_DATA_PATH / "install.db")
+        # Sessions are only known to work with the fake TrainzUtil of the benchmarks
+        self.trainz_util = TrainzUtil(install_path, timeout=15*60, persistent=persistent_trainzutil)
         self.assets = []
         self.failed_assets = []
-        self.average_speed = 0.0
-        self.installed_count = 0
+        self.skipped_assets = []
+        self.install_meter = ThroughputMeter(window=60.0, resolution=1.0)
+        self.stats = InstallStats()
+        self.progress_bus = ProgressBus(window, set_taskbar_progress)
         self.cancelled = False
 
-        # Create the installer and queue threads
+        # Create the installer thread and the install pipeline
         self.installer_thread = None
-        self.queue_thread = threading.Thread(target=self._run_queue)
-        self.queue = queue.Queue(maxsize=max_downloads)
+        self.pipeline = self._create_pipeline(stage_workers or {})
+
+    def _create_pipeline(self, stage_workers: Dict[str, int]) -> Pipeline:
+        pipeline = Pipeline(self._handle_pipeline_error, self._discard_job)
+        workers = {**DEFAULT_STAGE_WORKERS, **stage_workers}
+
+        # The first queue holds downloaded files that haven't been extracted yet
+        pipeline.add_stage("extract", self._extract_asset, workers["extract"], maxsize=self.max_downloads)
+
+        if self.downscale_textures:
+            pipeline.add_stage("downscale", self._downscale_asset, workers["downscale"], maxsize=STAGE_QUEUE_SIZE)
+
+        pipeline.add_stage("config", self._parse_config, workers["config"], maxsize=STAGE_QUEUE_SIZE)
+        pipeline.add_stage("install", self._install_asset, workers["install"], maxsize=STAGE_QUEUE_SIZE)
+        pipeline.add_stage("commit", self._commit_asset, workers["commit"], maxsize=STAGE_QUEUE_SIZE)
+        return pipeline
+
+    def _handle_pipeline_error(self, job: InstallJob, exc: Exception):
+        # The job has already been discarded by the pipeline
+        self._handle_error(exc)
+
+    def _discard_job(self, job: InstallJob):
+        job.cleanup()
+        self._release_download(job)
+
+    def _release_download(self, job: InstallJob):
+        if self.download_budget is not None:
+            self.download_budget.release(str(job.file_path))
 
-    def _run_queue(self):
-        while True:
-            file_path = self.queue.get()
+    def _get_cache_key(self, asset: Asset) -> str:
+        sha1 = asset.get_sha1(self.download_version)
 
-            # Check if the asset is None (end of queue)
-            if file_path is None or self.cancelled:
-                break
+        # Only the hashed version is content-addressed, the others are keyed by file and revision
+        if sha1 is not None:
+            return sha1
+
+        return f"{asset.file_id}_r{asset.revision}-{self.download_version}"
+
+    def _get_download_sizes(self, urls: List[str], cache_keys: Dict[str, str]) -> Dict[str, int]:
+        sizes = {}
+
+        # Cached files are linked into the temp folder instead of being downloaded again
+        for url in urls if self.cache is not None else []:
+            cached_path = self.cache.get(cache_keys[url])
+
+            if cached_path is None:
+                continue
 
             try:
-                self.install_from_path(file_path)
-            except Exception as e:
-                self._handle_error(e)
-                return
+                sizes[url] = cached_path.stat().st_size
+            except FileNotFoundError:
+                # Evicted by another instance in the meantime
+                continue
+
+            self.cached_urls.add(url)
+
+        # A request per file would double the requests of the download, the downloads report the remaining sizes
+        uncached_urls = [url for url in urls if url not in self.cached_urls]
+        sample_urls = random.sample(uncached_urls, SIZE_SAMPLE_COUNT) if len(uncached_urls) > SIZE_SAMPLE_COUNT else uncached_urls
+        sizes.update(DownloadClient.fetch_sizes(sample_urls))
+        return sizes
+
+    def _check_disk_space(self, urls: List[str], cache_keys: Dict[str, str]) -> bool:
+        temp_path = USER_DATA_PATH / "Temp"
+        temp_path.mkdir(parents=True, exist_ok=True)
+
+        self.cached_urls = set()
+        self.download_sizes = self._get_download_sizes(urls, cache_keys)
+        known_sizes = list(self.download_sizes.values())
+        average_size = sum(known_sizes) / len(known_sizes) if known_sizes else 0
+
+        download_size = sum(self.download_sizes.get(url, average_size) for url in urls if url not in self.cached_urls)
+        install_size = sum(self.download_sizes.get(url, average_size) for url in urls) * INSTALL_SIZE_FACTOR
+        largest_size = max(known_sizes, default=0)
+
+        temp_free = psutil.disk_usage(str(temp_path)).free - DISK_SPACE_RESERVE
+        install_free = psutil.disk_usage(str(self.install_path)).free - DISK_SPACE_RESERVE
+        temp_device = os.stat(temp_path).st_dev
+        install_device = os.stat(self.install_path).st_dev
+
+        # Downloads and installed assets compete for the same space on a single volume
+        if temp_device == install_device:
+            temp_free -= install_size
 
-            self.queue.task_done()
+        # Cache entries are hard links, files deleted after installing keep their space until they are evicted
+        cache_growth = 0
+        if self.cache is not None:
+            cache_growth += min(download_size, max(0, self.cache.max_size - self.cache.total_size))
 
-    def _run_installer(self, from_revision: int = 0, additional_options: Dict[str, Any] = None):
-        set_taskbar_progress(TaskbarProgressState.INDETERMINATE)
-        time.sleep(random.randint(2, 5))
+        if self.downscale_textures and self.texture_cache is not None:
+            cache_growth += min(install_size, max(0, self.texture_cache.max_size - self.texture_cache.total_size))
+
+        if cache_growth > 0:
+            cache_device = os.stat(USER_DATA_PATH / "Cache").st_dev
+
+            if cache_device == temp_device:
+                temp_free -= cache_growth
+
+            if cache_device == install_device:
+                install_free -= cache_growth
+
+        logger.info(f"Disk space: {readable_size(int(download_size))} to download, about {readable_size(int(install_size))} to install, up to {readable_size(int(cache_growth))} kept in the cache, {readable_size(max(0, int(temp_free)))} available for downloads")
+
+        if install_free < install_size or temp_free < largest_size:
+            required_size = max(install_size - install_free, largest_size - temp_free)
+            self.show_error("error", "Nicht genügend Speicherplatz", f"Für die Installation werden noch etwa {readable_size(int(required_size))} zusätzlicher Speicherplatz benötigt. Bitte gib Speicherplatz frei und versuche es erneut.")
+            return False
+
+        # Only keep as many downloaded files on disk as fit next to the installation
+        max_temp_size = int(temp_free)
+        if self.max_temp_size > 0:
+            max_temp_size = min(max_temp_size, self.max_temp_size)
+
+        if max_temp_size < download_size:
+            logger.info(f"Limiting downloaded files on disk to {readable_size(max_temp_size)}")
+
+        self.download_budget = ByteBudget(max_temp_size)
+        return True
+
+    def _schedule_downloads(self, assets_by_url: Dict[str, Asset]) -> List[str]:
+        model = InstallTimeModel(self.install_state.get_install_history())
+        download_rate = self.install_state.get_download_rate() or DEFAULT_DOWNLOAD_RATE
+        known_sizes = list(self.download_sizes.values())
+        average_size = sum(known_sizes) // len(known_sizes) if known_sizes else 0
+        scheduled_assets = []
+        unsized_assets = []
+
+        for url, asset in assets_by_url.items():
+            kuid = str(asset.kuid)
+
+            # Sizes are known for cached and sampled files and for assets installed before
+            size = self.download_sizes.get(url)
+            if size is None:
+                size = model.get_size(kuid)
+
+            install_time = model.predict(kuid, size if size is not None else average_size)
+
+            # Without a history the defaults are no better than the byte-based ETA
+            if model.fitted:
+                self.predicted_install_times[asset.kuid] = install_time
+
+            # Assets of unknown size can't be placed by the schedule, they keep their manifest order
+            if size is None:
+                unsized_assets.append(ScheduledAsset(url, average_size / download_rate, install_time))
+                continue
+
+            download_time = 0.0 if url in self.cached_urls else size / download_rate
+            scheduled_assets.append(ScheduledAsset(url, download_time, install_time))
+
+        # Keep the install stage busy and the large downloads off the critical path
+        scheduled_assets = schedule_downloads(scheduled_assets) + unsized_assets
+        install_workers = next(stage.workers for stage in self.pipeline.stages if stage.name == "install")
+        makespan = estimate_makespan(scheduled_assets, install_workers)
+
+        if makespan is not None:
+            logger.info(f"Expected installation time: {format_duration(makespan)} ({'fitted' if model.fitted else 'default'} install time model, {format_speed(download_rate)} download rate, {len(scheduled_assets) - len(unsized_assets)} of {len(scheduled_assets)} assets scheduled by size)")
+
+        return [scheduled_asset.url for scheduled_asset in scheduled_assets]
+
+    def _run_installer(self, from_revision: int = 0, additional_options: Dict[str, Any] = None, installed_assets: Optional[AssetsResponse] = None):
+        self.progress_bus.start()
+        self.progress_bus.set_taskbar_progress(TaskbarProgressState.INDETERMINATE)
+        time.sleep(random.randint(*START_DELAY))
 
         try:
-            assets_json = self.get_assets()
+            assets_json = fetch_assets(ASSETS_URL, USER_DATA_PATH / "Cache" / "manifest")
         except requests.RequestException as e:
             self.show_error("nointernet", "Keine Internetverbindung", f"Bitte überprüfe deine Internetverbindung und versuche es erneut.")
             return
+        except (OSError, ValidationError) as e:
+            self._handle_error(e)
+            return
 
-        # Filter assets by revision
-        self.assets = [asset for asset in assets_json.assets if asset.revision > from_revision]
+        if installed_assets is not None:
+            # Only install assets that were added or changed since the last installation
+            manifest_diff = diff_assets(installed_assets, assets_json)
+            logger.info(f"Manifest diff: {len(manifest_diff.added)} added, {len(manifest_diff.changed)} changed, {len(manifest_diff.unchanged)} unchanged, {len(manifest_diff.removed)} removed")
+            self.assets = manifest_diff.to_install
+
+            # A resumed installation keeps the revision cut-off it was started with
+            self.assets = [asset for asset in self.assets if asset.revision > from_revision]
+        else:
+            # Filter assets by revision
+            self.assets = [asset for asset in assets_json.assets if asset.revision > from_revision]
 
         # Check if there are any assets to install
         if not self.assets:
+            # An aborted installation may have installed every asset but not have been finished
+            if installed_assets is not None and self.install_state.is_install_in_progress():
+                logger.info("All assets of the aborted installation are installed, finishing it")
+                self._finish_install(assets_json, additional_options, from_revision)
+                return
+
             self.show_error("error", "Keine Assets gefunden", "Es wurden keine neuen Assets gefunden die installiert werden können.")
             return
 
+        assets_by_url = {asset.get_url(self.download_version): asset for asset in self.assets}
+        cache_keys = {url: self._get_cache_key(asset) for url, asset in assets_by_url.items()}
+
+        # Make sure the installation fits on disk before anything is changed
+        if not self._check_disk_space(list(assets_by_url), cache_keys):
+            return
+
+        # Remember the installation so it can be resumed if it gets aborted
+        self.install_state.begin_install(additional_options, from_revision, reset=installed_assets is None)
+
         # Get scripts asset from the list and remove it
         scripts_asset = next((asset for asset in self.assets if asset.kuid == SCRIPTS_KUID), None)
 
@@ -136,6 +346,8 @@ class AssetInstaller:
                 self._handle_error(e)
                 return
 
+            self.install_state.set_asset_status(scripts_asset, AssetStatus.INSTALLED)
+
             self.assets.remove(scripts_asset)
 
         try:
@@ -148,42 +360,77 @@ class AssetInstaller:
         self.update_progress("Warte auf die Installation von Assets...")
 
         def completion_callback(url: str, file_path: Path):
-            # Add the file path to the queue
-            self.queue.put(file_path)
-
-            # Start the queue thread if not running
-            if not self.queue_thread.is_alive():
-                self.queue_thread.start()
+            # Hand the downloaded file over to the install pipeline
+            self.pipeline.put(InstallJob(file_path, assets_by_url[url], size=file_path.stat().st_size))
 
         def error_callback(url: str, exc: Exception):
+            # Skip assets that couldn't be downloaded intact instead of aborting the installation
+            if isinstance(exc, DownloadVerificationError):
+                logger.warning(f"Skipping asset {assets_by_url[url].kuid}", exc_info=exc)
+                self.skipped_assets.append(assets_by_url[url])
+                self.stats.increment("skipped")
+                self._forget_prediction(assets_by_url[url].kuid)
+                return
+
             # Pass the exception to the error handler
             self._handle_error(exc)
 
-        urls = [asset.get_url(self.download_version) for asset in self.assets]
+        # The scripts asset has been installed separately
+        assets_by_url = {url: asset for url, asset in assets_by_url.items() if asset.kuid != SCRIPTS_KUID}
+        urls = self._schedule_downloads(assets_by_url)
+        # Archives without a matching hash are still checked with testzip
+        checksums = {url: asset.sha1 for url, asset in assets_by_url.items() if asset.get_sha1(self.download_version) is not None}
+
+        # Adapt the number of parallel downloads to the connection if allowed to go beyond the initial count
+        controller = None
+        if self.max_download_workers > self.download_workers:
+            controller = ConcurrencyController(self.download_workers, max_limit=self.max_download_workers)
 
         # Create the download client and start the download
-        self.download_client = DownloadClient(urls, USER_DATA_PATH / "Temp", completion_callback, error_callback)
+        self.download_client = DownloadClient(urls, USER_DATA_PATH / "Temp", completion_callback, error_callback, max_workers=self.download_workers, cache=self.cache, cache_keys=cache_keys, checksums=checksums, controller=controller, sizes=self.download_sizes, budget=self.download_budget)
+        self.pipeline.start()
         self.download_client.start()
+        last_stats_time = time.monotonic()
 
         # Wait for the download to finish
         while self.download_client.is_running():
             self._update_download_progress()
             time.sleep(0.5)
 
+            # Log which stage is limiting the throughput
+            if time.monotonic() - last_stats_time >= 30:
+                self._log_pipeline_stats()
+                last_stats_time = time.monotonic()
+
         # Remove download speed from progress
         downloaded_count = self.download_client.downloaded_count
         total_count = self.download_client.total_count
         self.update_extra_progress(f"Assets werden heruntergeladen... ({downloaded_count}/{total_count})", 100, "100%")
 
-        # Wait for the queue to finish
-        self.queue.put(None)
-        self.queue_thread.join()
+        # Wait for the pipeline to finish
+        self.pipeline.join()
+        self._log_pipeline_stats()
+        logger.info(f"Install stats: {self.stats.snapshot()}")
+        logger.info(f"Average throughput: {format_speed(self.download_client.meter.average_rate())} downloaded, {format_speed(self.install_meter.average_rate())} installed")
+
+        # Remember the download rate for scheduling the next installation
+        if self.download_client.downloaded_bytes > 0:
+            self.install_state.set_download_rate(self.download_client.meter.average_rate())
+
+        self._shutdown_texture_executor()
 
         # Don't continue if the installation was cancelled
         if self.cancelled:
             return
 
-        set_taskbar_progress(TaskbarProgressState.NORMAL, self.installed_count, len(self.assets))
+        self._finish_install(assets_json, additional_options, from_revision)
+
+    def _finish_install(self, assets_json: AssetsResponse, additional_options: Dict[str, Any], from_revision: int):
+        # A resumed installation without assets left is complete as well
+        if self.assets:
+            self.progress_bus.set_taskbar_progress(TaskbarProgressState.NORMAL, self.stats.get("installed"), len(self.assets))
+        else:
+            self.progress_bus.set_taskbar_progress(TaskbarProgressState.NORMAL, 1, 1)
 
         # Post-installation tasks and cleanup
         self.update_progress("Fertigstellung der Installation...", 100, "")
@@ -194,29 +441,31 @@ class AssetInstaller:
         except Exception as e:
             self._handle_error(e)
             return
+        finally:
+            self.trainz_util.close()
 
-        # Save current assets.json file
-        with open(USER_DATA_PATH / "assets.json", "w", encoding="utf-8") as f:
-            try:
-                json.dump(assets_json.model_dump(mode="json", by_alias=True), f, ensure_ascii=False)
-            except Exception as e:
-                self._handle_error(e)
-                return
+        # Skipped assets are recorded as such so that the next update picks them up again
+        try:
+            self.install_state.finish_install(assets_json, self.skipped_assets, from_revision)
+        except Exception as e:
+            self._handle_error(e)
+            return
 
         # Show completion message
-        if not self.failed_assets:
+        if not self.failed_assets and not self.skipped_assets:
             self.show_error("success", "Installation abgeschlossen", "Die Installation von U-Bahn Sim Berlin ist erfolgreich abgeschlossen.")
         else:
             self.show_error("warning", "Installation abgeschlossen", "Einige Assets konnten während der Installation nicht eingebunden werden. Bitte überprüfe im Content Manager bevor du das Spiel startest.")
 
     def _run_post_install(self, additional_options: Dict[str, Any]):
-        time.sleep(random.randint(5, 10))
+        time.sleep(random.randint(*FINISH_DELAY))
 
         # Try to commit failed assets
         for kuid in self.failed_assets.copy():
             try:
                 self.trainz_util.commit_asset(kuid)
                 self.failed_assets.remove(kuid)
+                self.install_state.update_status(kuid, AssetStatus.INSTALLED)
             except TrainzError:
                 pass
 
@@ -244,6 +493,15 @@ class AssetInstaller:
 
                 if "-disablerailjointsound" not in trainz_options:
                     trainz_options.append("-disablerailjointsound")
+            else:
+                # Undo the patch of an earlier installation
+                try:
+                    patcher.unpatch_sounds(self.install_path / "bin" / "trainz.exe")
+                except patcher.PatchError as e:
+                    logger.warning("Failed to roll back the patched sounds", exc_info=e)
+
+                if "-disablerailjointsound" in trainz_options:
+                    trainz_options.remove("-disablerailjointsound")
 
             # Write modified trainzoptions.txt file
             with open(trainzoptions_file, "w", encoding="utf-8") as f:
@@ -254,14 +512,85 @@ class AssetInstaller:
         keyboard_file = TEMPLATES_PATH / "static" / "data" / "keyboard_de.txt"  # TODO: Add support for QWERTY
         shutil.copy(keyboard_file, self.install_path / "UserData" / "settings" / "keyboard.txt")
 
+    def _estimate_remaining_download(self) -> Optional[float]:
+        # Sizes aren't part of the manifest, assume the remaining files are like the ones so far
+        average_file_size = self.download_client.average_file_size
+
+        if average_file_size is None:
+            return None
+
+        return (self.download_client.total_count - self.download_client.downloaded_count) * average_file_size
+
     def _update_download_progress(self):
         total_count = self.download_client.total_count
         downloaded_count = self.download_client.downloaded_count
         progress = (downloaded_count / total_count) * 100
+        label = f"{int(progress)}% ({format_speed(self.download_client.current_speed)})"
+
+        remaining_bytes = self._estimate_remaining_download()
+        eta = self.download_client.meter.eta(remaining_bytes) if remaining_bytes is not None else None
+
+        if eta is not None:
+            label += f" – noch {format_duration(eta)}"
+
+        self.update_extra_progress(f"Assets werden heruntergeladen ({downloaded_count}/{total_count})", progress, label)
+
+    def _estimate_install_time(self) -> Optional[float]:
+        if self.download_client is None:
+            return None
 
-        # Calculate average speed and update progress
-        self.average_speed = (self.average_speed + self.download_client.current_speed) / 2
-        self.update_extra_progress(f"Assets werden heruntergeladen ({downloaded_count}/{total_count})", progress, f"{int(progress)}% ({format_speed(self.average_speed)})")
+        remaining_download = self._estimate_remaining_download()
+
+        if remaining_download is None:
+            return None
+
+        if self.predicted_install_times:
+            eta = self._predict_remaining_install_time()
+        else:
+            # Everything downloaded but not installed yet, plus what is still to be downloaded
+            remaining_bytes = self.download_client.completed_size - self.install_meter.total_bytes + remaining_download
+            eta = self.install_meter.eta(remaining_bytes)
+
+        # Installation can't finish before the last download
+        download_eta = self.download_client.meter.eta(remaining_download)
+        if eta is not None and download_eta is not None:
+            eta = max(eta, download_eta)
+
+        return eta
+
+    def _predict_remaining_install_time(self) -> float:
+        install_workers = next(stage.workers for stage in self.pipeline.stages if stage.name == "install")
+
+        with self._history_lock:
+            remaining_time = sum(self.predicted_install_times.values())
+
+            # Correct the predictions by how far off they were for the installed assets so far
+            if self._predicted_done > 0:
+                remaining_time *= self._measured_done / self._predicted_done
+
+        return remaining_time / install_workers
+
+    def _forget_prediction(self, kuid: str):
+        with self._history_lock:
+            self.predicted_install_times.pop(kuid, None)
+
+    def _record_install_time(self, job: InstallJob):
+        # Predictions are keyed by the manifest, the config may spell the kuid differently
+        kuid = job.asset.kuid
+
+        with self._history_lock:
+            predicted_time = self.predicted_install_times.pop(kuid, None)
+
+            if predicted_time is not None:
+                self._predicted_done += predicted_time
+                self._measured_done += job.install_time
+
+        if job.size > 0:
+            self.install_state.record_install_duration(kuid, job.size, job.install_time)
+
+    def _log_pipeline_stats(self):
+        for stage_stats in self.pipeline.stats():
+            logger.info(f"Pipeline stage {stage_stats}")
 
     def _handle_error(self, exc: Exception):
         logger.error("Error during installation", exc_info=exc)
@@ -285,56 +614,87 @@ class AssetInstaller:
         # Stop the installer
         self.stop()
 
-    def install_from_path(self, file_path: Path):
-        with tempfile.TemporaryDirectory() as temp_dir:
-            temp_dir = Path(temp_dir)
+    def _extract_asset(self, job: InstallJob) -> InstallJob:
+        job.temp_dir = Path(tempfile.mkdtemp())
 
-            # Extract the asset to the temporary directory
-            with zipfile.ZipFile(file_path, "r") as zf:
-                zf.extractall(temp_dir)
+        # Extract the asset to the temporary directory
+        with span("extract", kuid=job.kuid, bytes=job.size), zipfile.ZipFile(job.file_path, "r") as zf:
+            zf.extractall(job.temp_dir)
 
-            # Load the asset config file
-            config_file = TrainzConfig(temp_dir / "config.txt", encoding="auto")
+        # Delete the downloaded file
+        job.file_path.unlink(missing_ok=True)
+        self._release_download(job)
+        return job
 
-            # Update the progress
-            progress = (self.installed_count / len(self.assets)) * 100
-            set_taskbar_progress(TaskbarProgressState.NORMAL, self.installed_count, len(self.assets))
-            self.update_progress(f"Installiere Asset \"{config_file.username}\" <{config_file.kuid}>...", progress, f"{int(progress)}%")
+    def _downscale_asset(self, job: InstallJob) -> InstallJob:
+        start_time = time.perf_counter()
 
-            # Downscale textures if enabled
-            if self.downscale_textures:
-                for image_file in temp_dir.glob("**/*"):
-                    # Skip directories
-                    if not image_file.is_file():
-                        continue
+        with span("downscale", kuid=job.kuid) as downscale_span:
+            results = downscale_textures(job.temp_dir, self.texture_executor, self.texture_cache)
+            downscale_span.set(textures=len(results))
 
-                    # Skip non-image files
-                    if image_file.suffix.lower() not in [".bmp", ".jpg", ".jpeg", ".tga"]:
-                        continue
+        downscaled_count = sum(result.downscaled for result in results)
+        cached_count = sum(result.cached for result in results)
+        logger.info(f"Downscaled {downscaled_count} of {len(results)} textures of {job.file_path.name} ({cached_count} from cache) in {time.perf_counter() - start_time:.2f}s")
+        return job
 
-                    with open(image_file, "rb") as f:
-                        image = Image.open(io.BytesIO(f.read()))
+    def _parse_config(self, job: InstallJob) -> InstallJob:
+        # Load the asset config file
+        with span("parse_config", kuid=job.kuid):
+            job.config = TrainzConfig(job.temp_dir / "config.txt", encoding="auto")
+        return job
 
-                        # Don't downscale images smaller than 512x512
-                        if image.width <= 512 or image.height <= 512:
-                            continue
+    def _install_asset(self, job: InstallJob) -> Optional[InstallJob]:
+        if self.cancelled:
+            self._discard_job(job)
+            return None
 
-                    new_image = image.resize((image.width // 2, image.height // 2), Image.Resampling.BICUBIC)
-                    new_image.save(image_file)
+        # Update the progress
+        installed_count = self.stats.get("installed")
+        progress = (installed_count / len(self.assets)) * 100
+        label = f"{int(progress)}%"
 
-            # Install the asset
-            self.trainz_util.delete_asset(config_file.kuid)
-            self.trainz_util.install_from_path(temp_dir)
+        eta = self._estimate_install_time()
+        if eta is not None:
+            label += f" – noch {format_duration(eta)}"
 
-            try:
-                self.trainz_util.commit_asset(config_file.kuid)
-            except TrainzError:
-                self.failed_assets.append(config_file.kuid)
+        self.progress_bus.set_taskbar_progress(TaskbarProgressState.NORMAL, installed_count, len(self.assets))
+        self.update_progress(f"Installiere Asset \"{job.config.username}\" <{job.config.kuid}>...", progress, label)
 
-            self.installed_count += 1
+        # Install the asset, timing only TrainzUtil itself and not the wait for the commit stage
+        start_time = self.trainz_util.command_time
 
-        # Delete the downloaded file
-        file_path.unlink(missing_ok=True)
+        with span("install", kuid=job.kuid, bytes=job.size):
+            self.trainz_util.delete_asset(job.config.kuid)
+            self.trainz_util.install_from_path(job.temp_dir)
+
+        job.install_time += self.trainz_util.command_time - start_time
+        return job
+
+    def _commit_asset(self, job: InstallJob) -> None:
+        status = AssetStatus.INSTALLED
+        start_time = self.trainz_util.command_time
+
+        try:
+            with span("commit", kuid=job.kuid):
+                self.trainz_util.commit_asset(job.config.kuid)
+
+            job.install_time += self.trainz_util.command_time - start_time
+            self._record_install_time(job)
+        except TrainzError:
+            self.failed_assets.append(job.config.kuid)
+            self.stats.increment("failed")
+            self._forget_prediction(job.asset.kuid)
+            status = AssetStatus.UNCOMMITTED
+        finally:
+            job.cleanup()
+
+        # Record every asset right away so an aborted installation can be resumed
+        if job.asset is not None:
+            self.install_state.set_asset_status(job.asset, status)
+
+        self.stats.increment("installed")
+        self.install_meter.add(job.size)
 
     def install_scripts(self, asset: Asset):
         self.update_progress("Installiere Skripte, dies kann eine Weile dauern...")
@@ -357,10 +717,8 @@ class AssetInstaller:
             temp_filename.replace(local_filename)
 
         # Check and close TADDaemon if still running
-        for process in psutil.process_iter():
-            if process.name().lower() == "taddaemon.exe":
-                close_trainz_database()
-                break
+        if process_watcher.is_running(["taddaemon.exe"], max_age=0):
+            close_trainz_database()
 
         # Extract the scripts asset to the install path
         with zipfile.ZipFile(local_filename, "r") as zf:
@@ -370,50 +728,47 @@ class AssetInstaller:
         local_filename.unlink(missing_ok=True)
 
     def update_progress(self, text: Optional[str] = None, progress: Optional[float] = None, label: Optional[str] = None, intermediate: Optional[bool] = None, color: Optional[str] = None):
-        text = json.dumps(text, ensure_ascii=False)
-        progress = f"{progress:.2f}" if progress is not None else "null"
-        label = json.dumps(label, ensure_ascii=False)
-        self.window.evaluate_js(f'updateProgress({text}, {progress}, {label}, {json.dumps(intermediate)}, {json.dumps(color)})')
+        self.progress_bus.update_progress(text, progress, label, intermediate, color)
 
     def update_extra_progress(self, text: Optional[str] = None, progress: Optional[float] = None, label: Optional[str] = None):
-        text = json.dumps(text, ensure_ascii=False)
-        progress = f"{progress:.2f}" if progress is not None else "null"
-        label = json.dumps(label, ensure_ascii=False)
-        self.window.evaluate_js(f'updateExtraProgress({text}, {progress}, {label})')
+        self.progress_bus.update_extra_progress(text, progress, label)
 
     def show_error(self, type: str, title: str, message: str):
+        # Errors end the installation, send the pending updates before the error page replaces them
+        self.progress_bus.close()
         set_taskbar_progress(TaskbarProgressState.NO_PROGRESS)
         title = json.dumps(title, ensure_ascii=False)
         message = json.dumps(message, ensure_ascii=False)
         self.window.evaluate_js(f'showError("{type}", {title}, {message})')
 
-    def start(self, from_revision: int = 0, additional_options: Dict[str, Any] = None):
-        self.installer_thread = threading.Thread(target=self._run_installer, args=(from_revision, additional_options))
+    def _run(self, *args):
+        if self.trace:
+            tracer.start()
+
+        try:
+            with span("installation"):
+                self._run_installer(*args)
+        finally:
+            # Written for aborted installations as well, they are the interesting ones
+            if self.trace:
+                tracer.stop(USER_DATA_PATH / "Traces" / f"install-{time.strftime('%Y%m%d-%H%M%S')}.json")
+
+    def start(self, from_revision: int = 0, additional_options: Dict[str, Any] = None, installed_assets: Optional[AssetsResponse] = None):
+        self.installer_thread = threading.Thread(target=self._run, args=(from_revision, additional_options, installed_assets))
         self.installer_thread.start()
 
     def stop(self):
         self.cancelled = True
-        self.queue.put(None)
-        self.queue.join()
-        self.installer_thread.join()
-        self.download_client.stop()
-
-    @staticmethod
-    def get_assets(from_revision: int = 0) -> AssetsResponse:
-        # Build the request URL
-        if from_revision > 0:
-            request_url = f"{ASSETS_URL}?revision={from_revision}"
-        else:
-            request_url = ASSETS_URL
+        self.pipeline.stop()
 
-        r = requests.get(request_url, headers={"User-Agent": USER_AGENT})
-        r.raise_for_status()
+        if self.download_client is not None:
+            self.download_client.stop()
 
-        # Parse the JSON response
-        return AssetsResponse.model_validate(r.json())
+        self.trainz_util.close()
+        self._shutdown_texture_executor()
+        self.progress_bus.close()
 
-    @staticmethod
-    def load_assets(file_path: Path) -> AssetsResponse:
-        # Load the assets from the file
-        with open(file_path, "r", encoding="utf-8") as f:
-            return AssetsResponse.model_validate(json.load(f))
+    def _shutdown_texture_executor(self):
+        if self.texture_executor is not None:
+            self.texture_executor.shutdown(wait=False, cancel_futures=True)
+            self.texture_executor = None
@@ -0,0 +1,75 @@
+import threading
+import time
+
+from typing import Optional
+
+__all__ = ["ThroughputMeter"]
+
+
+class ThroughputMeter:
+    """Bytes per second over a sliding time window, fed from any number of threads.
+
+    The window is split into fixed time buckets kept in a ring buffer, so recording is O(1) and
+    old samples drop out on their own instead of being averaged in forever.
+    """
+
+    def __init__(self, window: float = 10.0, resolution: float = 0.25):
+        self.window = window
+        self.resolution = resolution
+        self.total_bytes = 0
+        self.start_time: Optional[float] = None
+        self._size = max(1, round(window / resolution))
+        self._bytes = [0] * self._size
+        self._indices = [-1] * self._size
+        self._lock = threading.Lock()
+
+    def _bucket(self, now: float) -> int:
+        return int(now / self.resolution)
+
+    def add(self, size: int):
+        now = time.monotonic()
+        index = self._bucket(now)
+        slot = index % self._size
+
+        with self._lock:
+            if self.start_time is None:
+                self.start_time = now
+
+            # Reuse the slot of a bucket that has left the window
+            if self._indices[slot] != index:
+                self._indices[slot] = index
+                self._bytes[slot] = 0
+
+            self._bytes[slot] += size
+            self.total_bytes += size
+
+    def rate(self) -> float:
+        now = time.monotonic()
+        index = self._bucket(now)
+
+        with self._lock:
+            if self.start_time is None:
+                return 0.0
+
+            window_bytes = sum(size for size, bucket in zip(self._bytes, self._indices) if index - self._size < bucket <= index)
+
+            # Don't underestimate the rate before a full window has passed
+            elapsed = min(self.window, now - self.start_time)
+
+        return window_bytes / elapsed if elapsed > 0 else 0.0
+
+    def eta(self, remaining_bytes: float) -> Optional[float]:
+        rate = self.rate()
+
+        if rate <= 0:
+            return None
+
+        return max(0.0, remaining_bytes) / rate
+
+    def average_rate(self) -> float:
+        with self._lock:
+            if self.start_time is None:
+                return 0.0
+
+            elapsed = time.monotonic() - self.start_time
+            return self.total_bytes / elapsed if elapsed > 0 else 0.0
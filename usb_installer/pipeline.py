@@ -0,0 +1,179 @@
+import logging
+import queue
+import threading
+import time
+
+from dataclasses import dataclass
+from typing import Any, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["Pipeline", "Stage", "StageStats"]
+
+# Marks the end of the input of a stage
+_END = object()
+
+
+@dataclass
+class StageStats:
+    name: str
+    workers: int
+    queue_depth: int
+    processed_count: int
+    busy_time: float
+    blocked_time: float
+
+    def __str__(self):
+        return f"{self.name}: {self.processed_count} done, {self.queue_depth} queued, {self.busy_time:.1f}s busy, {self.blocked_time:.1f}s blocked ({self.workers} workers)"
+
+
+class Stage:
+    def __init__(self, pipeline: "Pipeline", name: str, func: Callable[[Any], Any], workers: int = 1, maxsize: int = 0):
+        self.pipeline = pipeline
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.next_stage: Optional[Stage] = None
+        self.threads: List[threading.Thread] = []
+        self.processed_count = 0
+        self.busy_time = 0.0
+        self.blocked_time = 0.0
+        self._lock = threading.Lock()
+
+    def put(self, item: Any):
+        # Don't block forever on a full queue if the pipeline gets stopped
+        while not self.pipeline.stopped:
+            try:
+                self.queue.put(item, timeout=0.5)
+            except queue.Full:
+                continue
+
+            # The pipeline may have been stopped and drained while the item was being added
+            if self.pipeline.stopped:
+                self.drain()
+
+            return
+
+        self.pipeline.discard(item)
+
+    def drain(self):
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+
+            self.pipeline.discard(item)
+
+    def start(self):
+        self.threads = [threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True) for i in range(self.workers)]
+
+        for thread in self.threads:
+            thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                if self.pipeline.stopped:
+                    break
+
+                continue
+
+            if item is _END:
+                break
+
+            if self.pipeline.stopped:
+                self.pipeline.discard(item)
+                continue
+
+            start_time = time.perf_counter()
+
+            try:
+                result = self.func(item)
+            except Exception as e:
+                logger.error(f"Error in pipeline stage {self.name}", exc_info=e)
+                self.pipeline.discard(item)
+                self.pipeline.error_callback(item, e)
+                continue
+            finally:
+                busy_time = time.perf_counter() - start_time
+
+            with self._lock:
+                self.processed_count += 1
+                self.busy_time += busy_time
+
+            # Returning None drops the item from the pipeline
+            if result is None or self.next_stage is None:
+                continue
+
+            start_time = time.perf_counter()
+            self.next_stage.put(result)
+
+            with self._lock:
+                self.blocked_time += time.perf_counter() - start_time
+
+    def close(self):
+        for _ in self.threads:
+            self.put(_END)
+
+        for thread in self.threads:
+            if thread is not threading.current_thread():
+                thread.join()
+
+    def stats(self) -> StageStats:
+        with self._lock:
+            return StageStats(self.name, self.workers, self.queue.qsize(), self.processed_count, self.busy_time, self.blocked_time)
+
+
+class Pipeline:
+    """Chain of stages, each with its own worker threads and a bounded input queue."""
+
+    def __init__(self, error_callback: Callable[[Any, Exception], None], cleanup_callback: Optional[Callable[[Any], None]] = None):
+        self.error_callback = error_callback
+        self.cleanup_callback = cleanup_callback
+        self.stages: List[Stage] = []
+        self.stopped = False
+
+    def add_stage(self, name: str, func: Callable[[Any], Any], workers: int = 1, maxsize: int = 0) -> Stage:
+        stage = Stage(self, name, func, workers, maxsize)
+
+        if self.stages:
+            self.stages[-1].next_stage = stage
+
+        self.stages.append(stage)
+        return stage
+
+    def put(self, item: Any):
+        self.stages[0].put(item)
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+
+    def join(self):
+        # Close the stages in order so every item can pass through the remaining ones
+        for stage in self.stages:
+            stage.close()
+
+    def discard(self, item: Any):
+        # Items that leave the pipeline without passing through all stages
+        if item is _END or self.cleanup_callback is None:
+            return
+
+        try:
+            self.cleanup_callback(item)
+        except Exception as e:
+            logger.warning("Failed to clean up pipeline item", exc_info=e)
+
+    def stop(self):
+        self.stopped = True
+
+        # Idle workers notice the stop within their poll interval, queued items are cleaned up here
+        for stage in self.stages:
+            stage.drain()
+
+    def stats(self) -> List[StageStats]:
+        return [stage.stats() for stage in self.stages]
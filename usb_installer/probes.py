@@ -0,0 +1,104 @@
+import json
+import logging
+import threading
+
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+import psutil
+
+from usb_installer import __version__
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["ProbeCache", "detect_nvidia_gpu", "fetch_installer_info", "get_invalidation_key"]
+
+# Version information of the latest installer
+INSTALLER_INFO_URL = "https://dl.u7-trainz.de/installer.json"
+
+
+def get_invalidation_key() -> str:
+    # Hardware only changes across reboots, drivers mostly too
+    return f"{__version__}-{int(psutil.boot_time())}"
+
+
+class ProbeCache:
+    """Results of slow system probes, kept on disk until the invalidation key changes."""
+
+    def __init__(self, cache_file: Path, key: Optional[str] = None):
+        self.cache_file = cache_file
+        self.key = key or get_invalidation_key()
+        self._lock = threading.Lock()
+        self._entries: Optional[Dict[str, Any]] = None
+
+    def _load(self) -> Dict[str, Any]:
+        if self._entries is None:
+            try:
+                with open(self.cache_file, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                data = {}
+
+            self._entries = data.get("entries", {}) if data.get("key") == self.key else {}
+
+        return self._entries
+
+    def _save(self):
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        temp_file = self.cache_file.with_suffix(".tmp")
+
+        with open(temp_file, "w", encoding="utf-8") as f:
+            json.dump({"key": self.key, "entries": self._entries}, f)
+
+        temp_file.replace(self.cache_file)
+
+    def get(self, name: str, probe: Callable[[], Any]) -> Any:
+        with self._lock:
+            entries = self._load()
+
+            if name in entries:
+                return entries[name]
+
+        # Run the probe outside of the lock so other probes aren't blocked
+        value = probe()
+
+        with self._lock:
+            self._load()[name] = value
+
+            try:
+                self._save()
+            except OSError as e:
+                logger.warning(f"Failed to save probe cache {self.cache_file}", exc_info=e)
+
+        return value
+
+
+def detect_nvidia_gpu() -> bool:
+    import pythoncom
+    import wmi
+
+    # WMI needs COM to be initialized in every thread
+    pythoncom.CoInitialize()
+
+    try:
+        # Query WMI for GPU information
+        gpu_info = wmi.WMI().Win32_VideoController()
+
+        # Check if user has an NVIDIA GPU
+        return any("nvidia" in gpu.Description.lower() for gpu in gpu_info)
+    finally:
+        pythoncom.CoUninitialize()
+
+
+def fetch_installer_info(timeout: float = 15) -> Optional[Dict[str, Any]]:
+    import requests
+
+    from usb_installer import USER_AGENT
+
+    try:
+        r = requests.get(INSTALLER_INFO_URL, headers={"User-Agent": USER_AGENT}, timeout=timeout)
+        r.raise_for_status()
+        return r.json()
+    except (requests.RequestException, ValueError) as e:
+        logger.warning("Failed to fetch installer info", exc_info=e)
+        return None
@@ -0,0 +1,73 @@
+import logging
+import threading
+import time
+
+from typing import Dict, Iterable, List, Optional
+
+import psutil
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["ProcessWatcher", "process_watcher"]
+
+
+class ProcessWatcher:
+    """Shared snapshot of the running processes, indexed by lower-case name.
+
+    A full scan of all processes is only done when the snapshot is older than the TTL, and waiting
+    for processes to exit uses psutil.wait_procs instead of polling the process list.
+    """
+
+    def __init__(self, ttl: float = 2.0):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._index: Dict[str, List[psutil.Process]] = {}
+        self._timestamp: Optional[float] = None
+
+    def _scan(self) -> Dict[str, List[psutil.Process]]:
+        index = {}
+
+        # Fetch the names in the same pass, processes that can't be accessed get None
+        for process in psutil.process_iter(["name"], ad_value=None):
+            name = process.info["name"]
+
+            if name:
+                index.setdefault(name.lower(), []).append(process)
+
+        return index
+
+    def _get_index(self, max_age: Optional[float] = None) -> Dict[str, List[psutil.Process]]:
+        max_age = self.ttl if max_age is None else max_age
+
+        with self._lock:
+            if self._timestamp is None or time.monotonic() - self._timestamp > max_age:
+                self._index = self._scan()
+                self._timestamp = time.monotonic()
+
+            return self._index
+
+    def invalidate(self):
+        with self._lock:
+            self._timestamp = None
+
+    def find(self, names: Iterable[str], max_age: Optional[float] = None) -> List[psutil.Process]:
+        index = self._get_index(max_age)
+        return [process for name in names for process in index.get(name.lower(), []) if process.is_running()]
+
+    def is_running(self, names: Iterable[str], max_age: Optional[float] = None) -> bool:
+        return bool(self.find(names, max_age))
+
+    def wait_for_exit(self, processes: List[psutil.Process], timeout: Optional[float] = None) -> bool:
+        _, alive = psutil.wait_procs(processes, timeout=timeout)
+
+        # The snapshot still lists the processes that are gone now
+        self.invalidate()
+
+        if alive:
+            logger.warning(f"{len(alive)} processes still running after {timeout}s")
+
+        return not alive
+
+
+# Shared by everything that needs to look for running processes
+process_watcher = ProcessWatcher()
@@ -0,0 +1,118 @@
+import collections
+import json
+import logging
+import threading
+
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from webview import Window
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["InstallStats", "ProgressBus"]
+
+# Updates per second sent to the webview
+DEFAULT_FRAME_RATE = 10
+
+
+class InstallStats:
+    """Counters shared between the installer threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = collections.Counter()
+
+    def increment(self, name: str, value: int = 1) -> int:
+        with self._lock:
+            self._counters[name] += value
+            return self._counters[name]
+
+    def get(self, name: str) -> int:
+        with self._lock:
+            return self._counters[name]
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counters)
+
+
+class ProgressBus:
+    """Coalesces progress updates and sends them to the webview at a fixed frame rate.
+
+    Callers only store the latest state of each channel, a single thread sends everything that
+    changed since the last tick with one evaluate_js call, so install threads never wait for the UI.
+    """
+
+    def __init__(self, window: Window, taskbar_callback: Callable[..., None], frame_rate: int = DEFAULT_FRAME_RATE):
+        self.window = window
+        self.taskbar_callback = taskbar_callback
+        self.interval = 1 / max(1, frame_rate)
+        self.thread: Optional[threading.Thread] = None
+        self.closed = False
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pending: Dict[str, Any] = {}
+        self._taskbar: Optional[Tuple] = None
+        self._flush_lock = threading.Lock()
+
+    def update_progress(self, text: Optional[str] = None, progress: Optional[float] = None, label: Optional[str] = None, intermediate: Optional[bool] = None, color: Optional[str] = None):
+        self._publish("progress", [text, round(progress, 2) if progress is not None else None, label, intermediate, color])
+
+    def update_extra_progress(self, text: Optional[str] = None, progress: Optional[float] = None, label: Optional[str] = None):
+        self._publish("extraProgress", [text, round(progress, 2) if progress is not None else None, label])
+
+    def set_taskbar_progress(self, *args):
+        with self._lock:
+            if self.closed:
+                return
+
+            self._taskbar = args
+
+    def _publish(self, channel: str, args: list):
+        with self._lock:
+            if self.closed:
+                return
+
+            # Only the latest state of each channel is sent
+            self._pending[channel] = args
+
+    def start(self):
+        if self.thread is not None:
+            return
+
+        self.thread = threading.Thread(target=self._run, name="ProgressBus", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self._wakeup.wait(self.interval):
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            taskbar, self._taskbar = self._taskbar, None
+
+        # Keep batches in order if flush is called from another thread
+        with self._flush_lock:
+            try:
+                if taskbar is not None:
+                    self.taskbar_callback(*taskbar)
+
+                if pending:
+                    self.window.evaluate_js(f"applyProgress({json.dumps(pending, ensure_ascii=False)})")
+            except Exception as e:
+                logger.warning("Failed to send progress update", exc_info=e)
+
+    def close(self):
+        # Send the last updates and drop everything after that
+        self.flush()
+
+        with self._lock:
+            self.closed = True
+            self._pending.clear()
+            self._taskbar = None
+
+        self._wakeup.set()
+
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
@@ -0,0 +1,204 @@
+import enum
+import json
+import logging
+
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import Enum, String, create_engine, delete, select
+from sqlalchemy.orm import DeclarativeBase, Mapped, Session, mapped_column
+
+from usb_installer.assets import Asset, AssetsResponse
+from usb_installer.trainz import Kuid
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["AssetState", "AssetStatus", "InstallHistory", "InstallState"]
+
+
+class AssetStatus(enum.StrEnum):
+    INSTALLED = "installed"
+    UNCOMMITTED = "uncommitted"
+    SKIPPED = "skipped"
+
+
+# Assets that don't need to be installed again
+INSTALLED_STATUSES = (AssetStatus.INSTALLED, AssetStatus.UNCOMMITTED)
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class Base(DeclarativeBase):
+    pass
+
+
+class AssetState(Base):
+    __tablename__ = "assets"
+
+    kuid: Mapped[str] = mapped_column(String, primary_key=True)
+    username: Mapped[str]
+    sha1: Mapped[str]
+    file_id: Mapped[str]
+    revision: Mapped[int]
+    status: Mapped[AssetStatus] = mapped_column(Enum(AssetStatus, native_enum=False), index=True)
+    installed_at: Mapped[Optional[datetime]]
+    updated_at: Mapped[datetime] = mapped_column(default=_utcnow, onupdate=_utcnow)
+
+    def to_asset(self) -> Asset:
+        # Rows were validated when they were written
+        return Asset.model_construct(username=self.username, kuid=Kuid(self.kuid), sha1=self.sha1, file_id=self.file_id, revision=self.revision)
+
+
+class InstallHistory(Base):
+    __tablename__ = "install_history"
+
+    kuid: Mapped[str] = mapped_column(String, primary_key=True)
+    size: Mapped[int]
+    install_duration: Mapped[float]
+    updated_at: Mapped[datetime] = mapped_column(default=_utcnow, onupdate=_utcnow)
+
+
+class Metadata(Base):
+    __tablename__ = "metadata"
+
+    key: Mapped[str] = mapped_column(String, primary_key=True)
+    value: Mapped[str]
+
+
+class InstallState:
+    """Install state of every asset, stored in SQLite and updated per asset."""
+
+    def __init__(self, db_path: Path):
+        self.engine = create_engine(f"sqlite:///{db_path}")
+        Base.metadata.create_all(self.engine)
+
+    def _get_metadata(self, session: Session, key: str) -> Optional[Any]:
+        value = session.get(Metadata, key)
+        return json.loads(value.value) if value is not None else None
+
+    def _set_metadata(self, session: Session, key: str, value: Any):
+        session.merge(Metadata(key=key, value=json.dumps(value)))
+
+    def _upsert_assets(self, session: Session, assets: List[Asset], status: AssetStatus, rows: Optional[Dict[str, AssetState]] = None):
+        now = _utcnow()
+
+        if rows is None:
+            rows = {row.kuid: row for row in session.scalars(select(AssetState).where(AssetState.kuid.in_([str(asset.kuid) for asset in assets])))}
+
+        for asset in assets:
+            row = rows.get(asset.kuid)
+
+            if row is None:
+                row = AssetState(kuid=str(asset.kuid))
+                rows[asset.kuid] = row
+                session.add(row)
+
+            row.username = asset.username
+            row.sha1 = asset.sha1
+            row.file_id = asset.file_id
+            row.revision = asset.revision
+            row.status = status
+            row.installed_at = now if status in INSTALLED_STATUSES else None
+
+    def migrate_from_json(self, json_path: Path) -> bool:
+        with Session(self.engine) as session, session.begin():
+            # Only import once into an empty store
+            if self._get_metadata(session, "last_revision") is not None or not json_path.exists():
+                return False
+
+            with open(json_path, "r", encoding="utf-8") as f:
+                assets_json = AssetsResponse.model_validate(json.load(f))
+
+            self._upsert_assets(session, assets_json.assets, AssetStatus.INSTALLED, rows={})
+            self._set_metadata(session, "last_revision", assets_json.last_revision)
+
+        logger.info(f"Imported {len(assets_json.assets)} assets from {json_path}")
+        return True
+
+    def get_last_revision(self) -> Optional[int]:
+        with Session(self.engine) as session:
+            return self._get_metadata(session, "last_revision")
+
+    def get_installed_assets(self) -> Optional[AssetsResponse]:
+        with Session(self.engine) as session:
+            last_revision = self._get_metadata(session, "last_revision")
+            rows = session.scalars(select(AssetState).where(AssetState.status.in_(INSTALLED_STATUSES))).all()
+
+            if last_revision is None and not rows:
+                return None
+
+            return AssetsResponse.model_construct(assets=[row.to_asset() for row in rows], last_revision=last_revision or 0)
+
+    def begin_install(self, additional_options: Optional[Dict[str, Any]] = None, from_revision: int = 0, reset: bool = False):
+        with Session(self.engine) as session, session.begin():
+            # A new installation doesn't contain the assets of an earlier one, only updates and resumes build on them
+            if reset:
+                session.execute(delete(AssetState))
+
+            self._set_metadata(session, "install_in_progress", True)
+            self._set_metadata(session, "additional_options", additional_options or {})
+            self._set_metadata(session, "from_revision", from_revision)
+
+    def is_install_in_progress(self) -> bool:
+        with Session(self.engine) as session:
+            return bool(self._get_metadata(session, "install_in_progress"))
+
+    def get_additional_options(self) -> Dict[str, Any]:
+        with Session(self.engine) as session:
+            return self._get_metadata(session, "additional_options") or {}
+
+    def get_from_revision(self) -> int:
+        with Session(self.engine) as session:
+            return self._get_metadata(session, "from_revision") or 0
+
+    def set_asset_status(self, asset: Asset, status: AssetStatus):
+        with Session(self.engine) as session, session.begin():
+            self._upsert_assets(session, [asset], status)
+
+    def update_status(self, kuid: str, status: AssetStatus):
+        with Session(self.engine) as session, session.begin():
+            row = session.get(AssetState, str(kuid))
+
+            if row is not None:
+                row.status = status
+
+    def record_install_duration(self, kuid: str, size: int, duration: float):
+        with Session(self.engine) as session, session.begin():
+            session.merge(InstallHistory(kuid=str(kuid), size=size, install_duration=duration))
+
+    def get_install_history(self) -> Dict[str, Tuple[int, float]]:
+        with Session(self.engine) as session:
+            return {row.kuid: (row.size, row.install_duration) for row in session.scalars(select(InstallHistory))}
+
+    def get_download_rate(self) -> Optional[float]:
+        with Session(self.engine) as session:
+            return self._get_metadata(session, "download_rate")
+
+    def set_download_rate(self, rate: float):
+        with Session(self.engine) as session, session.begin():
+            self._set_metadata(session, "download_rate", rate)
+
+    def finish_install(self, assets_json: AssetsResponse, skipped_assets: List[Asset], from_revision: int = 0):
+        skipped_kuids = {asset.kuid for asset in skipped_assets}
+
+        with Session(self.engine) as session, session.begin():
+            rows = {row.kuid: row for row in session.scalars(select(AssetState))}
+
+            # Installed assets have been recorded one by one, this adds the ones below the revision cut-off which
+            # were already present. Anything else without a row wasn't installed and is picked up by the next update.
+            missing_assets = [asset for asset in assets_json.assets if asset.kuid not in rows and asset.kuid not in skipped_kuids and asset.revision <= from_revision]
+
+            # Forget assets that are no longer part of the manifest
+            removed_kuids = rows.keys() - {asset.kuid for asset in assets_json.assets}
+
+            self._upsert_assets(session, missing_assets, AssetStatus.INSTALLED, rows)
+            self._upsert_assets(session, skipped_assets, AssetStatus.SKIPPED, rows)
+
+            for kuid in removed_kuids:
+                session.delete(rows[kuid])
+
+            self._set_metadata(session, "last_revision", assets_json.last_revision)
+            self._set_metadata(session, "install_in_progress", False)
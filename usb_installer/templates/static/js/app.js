@@ -9,8 +9,11 @@ let isNvidiaGPU = false;
 // Object containing additional options for the installation
 const additionalOptions = {};
 
-function showMainPage() {
-    pywebview.api.isInstalled().then(function(response) {
+function showMainPage(installed = null) {
+    // Use the state from the start-up probes if available
+    const isInstalled = installed !== null ? Promise.resolve(installed) : pywebview.api.isInstalled();
+
+    isInstalled.then(function(response) {
         pywebview.api.setConfirmClose(true);
         $('#main').load(response ? '/views/installed.html' : '/views/landing.html', function() {
             $('#menu').removeClass('d-none');
@@ -171,6 +174,27 @@ function startUpdate() {
     });
 }
 
+function resumeInstall() {
+    // Resume the aborted installation
+    pywebview.api.resumeInstall().then(function(response) {
+        $('#main').load('/views/progress.html', function() {
+            $('#menu').addClass('d-none');
+            updateProgress("Installation wird vorbereitet...", 100, "", true, "primary");
+        });
+    });
+}
+
+function applyProgress(batch) {
+    // Batched updates sent by the installer once per frame
+    if (batch.progress !== undefined) {
+        updateProgress(...batch.progress);
+    }
+
+    if (batch.extraProgress !== undefined) {
+        updateExtraProgress(...batch.extraProgress);
+    }
+}
+
 function updateProgress(text, progressWidth = null, progressLabel = null, intermediate = null, color = null) {
     // Hide progress bar if text is null
     if (text === null) {
@@ -247,43 +271,39 @@ function openTrainz() {
 // Main entry point
 //*************************
 window.addEventListener('pywebviewready', function() {
-    // Check for installer updates
-    $.getJSON("https://dl.u7-trainz.de/installer.json", function (data) {
-        $("#updateVersion").text(`v${data.versionName}`);
-        $("#updateModal .btn-primary").prop("href", data.downloadUrl);
+    // Run all start-up checks at once
+    pywebview.api.getStartupState().then(function(state) {
+        // Show error if there is no internet connection
+        if (state.installerInfo === null) {
+            showError("nointernet", "Keine Internetverbindung", "Bitte überprüfe deine Internetverbindung und versuche es erneut.");
+            return;
+        }
+
+        // Check for installer updates
+        $("#updateVersion").text(`v${state.installerInfo.versionName}`);
+        $("#updateModal .btn-primary").prop("href", state.installerInfo.downloadUrl);
 
         // Set the updateAvailable flag if there is a new version
-        if (data.version > versionCode) {
+        if (state.installerInfo.version > versionCode) {
             updateAvailable = true;
         }
 
-        // Check if Trainz or Content Manager is running
-        pywebview.api.isTrainzRunning().then(function(response) {
-            // Show error if Trainz is running
-            if (response) {
-                showError("trainzrunning", "Trainz Simulator läuft bereits", "Bitte schließe Trainz oder den Content Manager und versuche es erneut.");
-                return;
-            }
+        // Show error if Trainz or Content Manager is running
+        if (state.trainzRunning) {
+            showError("trainzrunning", "Trainz Simulator läuft bereits", "Bitte schließe Trainz oder den Content Manager und versuche es erneut.");
+            return;
+        }
 
-            // Check if the user has an Nvidia GPU
-            pywebview.api.isNvidiaGPU().then(function(response) {
-                // Set the isNvidiaGPU flag
-                isNvidiaGPU = response;
+        // Set the isNvidiaGPU flag
+        isNvidiaGPU = state.nvidiaGPU;
 
-                // Check if installation has been aborted
-                pywebview.api.isInstallationAborted().then(function (response) {
-                    if (response) {
-                        $("#main").load("/views/resume.html");
-                        return;
-                    }
+        // Check if installation has been aborted
+        if (state.installationAborted) {
+            $("#main").load("/views/resume.html");
+            return;
+        }
 
-                    showMainPage();
-                });
-            });
-        });
-    }).fail(function () {
-        // Show error if there is no internet connection
-        showError("nointernet", "Keine Internetverbindung", "Bitte überprüfe deine Internetverbindung und versuche es erneut.");
+        showMainPage(state.installed);
     });
 });
 
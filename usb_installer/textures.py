@@ -0,0 +1,78 @@
+import hashlib
+import io
+import logging
+
+from concurrent.futures import Executor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional
+
+from PIL import Image
+
+from usb_installer.cache import FileCache
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["DownscaleResult", "downscale_image", "downscale_textures"]
+
+# File types that are considered textures
+TEXTURE_SUFFIXES = (".bmp", ".jpg", ".jpeg", ".tga")
+
+# Don't downscale images smaller than this
+MIN_TEXTURE_SIZE = 512
+
+
+# Identifies the downscale parameters in cache keys, change it whenever the output changes
+DOWNSCALE_PARAMS = f"half-bicubic-{MIN_TEXTURE_SIZE}"
+
+
+@dataclass
+class DownscaleResult:
+    image_file: Path
+    downscaled: bool = False
+    cached: bool = False
+    cache_key: Optional[str] = None
+    error: Optional[str] = None
+
+
+def downscale_image(image_file: Path, cache: Optional[FileCache] = None) -> DownscaleResult:
+    # Runs in a worker process, so errors are returned instead of raised
+    try:
+        with open(image_file, "rb") as f:
+            data = f.read()
+
+        # Reuse the output of an earlier run for the same source image
+        cache_key = f"{hashlib.sha1(data).hexdigest()}-{DOWNSCALE_PARAMS}{image_file.suffix.lower()}"
+
+        if cache is not None and cache.fetch(cache_key, image_file):
+            return DownscaleResult(image_file, downscaled=True, cached=True)
+
+        image = Image.open(io.BytesIO(data))
+
+        if image.width <= MIN_TEXTURE_SIZE or image.height <= MIN_TEXTURE_SIZE:
+            return DownscaleResult(image_file)
+
+        new_image = image.resize((image.width // 2, image.height // 2), Image.Resampling.BICUBIC)
+        new_image.save(image_file)
+    except Exception as e:
+        return DownscaleResult(image_file, error=f"{type(e).__name__}: {e}")
+
+    return DownscaleResult(image_file, downscaled=True, cache_key=cache_key)
+
+
+def downscale_textures(directory: Path, executor: Executor, cache: Optional[FileCache] = None) -> List[DownscaleResult]:
+    image_files = [file for file in directory.glob("**/*") if file.suffix.lower() in TEXTURE_SUFFIXES and file.is_file()]
+    results = list(executor.map(downscale_image, image_files, [cache] * len(image_files)))
+
+    for result in results:
+        if result.error is not None:
+            logger.warning(f"Failed to downscale {result.image_file.relative_to(directory)}: {result.error}")
+
+        # Entries are added here so that only one process keeps track of the cache size
+        if cache is not None and result.cache_key is not None:
+            try:
+                cache.put(result.cache_key, result.image_file)
+            except OSError as e:
+                logger.warning(f"Failed to cache {result.image_file.name}", exc_info=e)
+
+    return results
@@ -0,0 +1,128 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["Span", "Tracer", "span", "tracer"]
+
+# Upper bound of recorded spans, about 200 bytes each
+MAX_EVENTS = 1_000_000
+
+
+class _NullSpan:
+    """Returned while tracing is disabled, so call sites cost a single attribute check."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    __slots__ = ("tracer", "name", "category", "args", "start")
+
+    def __init__(self, tracer: "Tracer", name: str, category: str, args: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+
+        self.tracer._record(self, time.perf_counter_ns())
+        return False
+
+    def set(self, **args):
+        # Add values that are only known once the work is done, like byte counts
+        self.args.update(args)
+
+
+class Tracer:
+    """Records spans as Chrome trace events, which can be opened in Perfetto or chrome://tracing."""
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._events: List[Dict[str, Any]] = []
+        self._threads: Dict[int, str] = {}
+        self._origin = time.perf_counter_ns()
+
+    def span(self, name: str, category: str = "installer", **args) -> Any:
+        if not self.enabled:
+            return _NULL_SPAN
+
+        return Span(self, name, category, args)
+
+    def _record(self, span: Span, end: int):
+        thread = threading.current_thread()
+        event = {
+            "name": span.name,
+            "cat": span.category,
+            "ph": "X",
+            "ts": (span.start - self._origin) / 1000,
+            "dur": (end - span.start) / 1000,
+            "pid": os.getpid(),
+            "tid": thread.ident,
+            "args": {key: str(value) if not isinstance(value, (int, float, bool)) else value for key, value in span.args.items()},
+        }
+
+        with self._lock:
+            if len(self._events) < MAX_EVENTS:
+                self._events.append(event)
+                self._threads.setdefault(thread.ident, thread.name)
+
+    def start(self):
+        with self._lock:
+            self._events = []
+            self._threads = {}
+            self._origin = time.perf_counter_ns()
+
+        self.enabled = True
+
+    def stop(self, trace_file: Optional[Path] = None) -> Optional[Path]:
+        self.enabled = False
+
+        with self._lock:
+            events, self._events = self._events, []
+            threads, self._threads = self._threads, {}
+
+        if trace_file is None:
+            return None
+
+        # Name the threads so the workers of every stage are grouped in the viewer
+        metadata = [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}} for tid, name in threads.items()]
+
+        trace_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(trace_file, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": metadata + events, "displayTimeUnit": "ms"}, f)
+
+        logger.info(f"Wrote {len(events)} trace events to {trace_file}")
+        return trace_file
+
+
+# Shared by all instrumented modules
+tracer = Tracer()
+
+
+def span(name: str, category: str = "installer", **args) -> Any:
+    return tracer.span(name, category, **args)
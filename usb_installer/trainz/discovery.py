@@ -0,0 +1,228 @@
+import abc
+import ctypes
+import dataclasses
+import logging
+import os
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from ctypes import wintypes
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["DiscoveryProvider", "FakeProvider", "FilesystemProvider", "RegistryProvider", "TrainzDiscovery", "TrainzInstallation"]
+
+# Range of supported product builds
+SUPPORTED_BUILDS = range(37625, 49934)
+
+# Registry keys of Trainz installations, native and 32-bit on 64-bit Windows, machine and virtual store
+PRODUCTS_KEY = "Software\\Auran\\Products\\TrainzSimulator"
+PRODUCTS_KEY_64BIT = "Software\\WOW6432Node\\Auran\\Products\\TrainzSimulator"
+VIRTUAL_STORE_PREFIX = "Software\\Classes\\VirtualStore\\Machine\\"
+
+# Folders below the known roots where Trainz is usually installed
+INSTALL_PATTERNS = ["N3V Games/Trainz Simulator*", "Auran/Trainz Simulator*", "Steam/steamapps/common/Trainz Simulator*"]
+
+
+@dataclass(frozen=True)
+class TrainzInstallation:
+    path: str
+    source: str
+    build: Optional[int] = None
+
+    @property
+    def executable(self) -> Path:
+        return Path(self.path) / "bin" / "Trainz.exe"
+
+
+class VSFixedFileInfo(ctypes.Structure):
+    # Leading fields of VS_FIXEDFILEINFO, the rest isn't needed
+    _fields_ = [
+        ("dwSignature", wintypes.DWORD),
+        ("dwStrucVersion", wintypes.DWORD),
+        ("dwFileVersionMS", wintypes.DWORD),
+        ("dwFileVersionLS", wintypes.DWORD),
+    ]
+
+
+def read_build(installation: TrainzInstallation) -> Optional[int]:
+    """Read the product build from the version resource of Trainz.exe, the last part of its file version."""
+    try:
+        version = ctypes.windll.version
+    except AttributeError:
+        # Not on Windows
+        return None
+
+    file_name = str(installation.executable)
+    size = version.GetFileVersionInfoSizeW(file_name, None)
+
+    if not size:
+        return None
+
+    buffer = ctypes.create_string_buffer(size)
+    info = ctypes.c_void_p()
+    length = wintypes.UINT()
+
+    if not version.GetFileVersionInfoW(file_name, 0, size, buffer) or not version.VerQueryValueW(buffer, "\\", ctypes.byref(info), ctypes.byref(length)):
+        return None
+
+    return ctypes.cast(info, ctypes.POINTER(VSFixedFileInfo)).contents.dwFileVersionLS & 0xFFFF
+
+
+class DiscoveryProvider(abc.ABC):
+    name = "provider"
+
+    @abc.abstractmethod
+    def find(self) -> List[TrainzInstallation]:
+        """Return the installations known to the provider, with their build if the provider knows it."""
+
+
+class RegistryProvider(DiscoveryProvider):
+    name = "registry"
+
+    def find(self) -> List[TrainzInstallation]:
+        try:
+            import winreg
+        except ModuleNotFoundError:
+            # Not on Windows
+            return []
+
+        roots = [
+            (winreg.HKEY_LOCAL_MACHINE, PRODUCTS_KEY),
+            (winreg.HKEY_CURRENT_USER, VIRTUAL_STORE_PREFIX + PRODUCTS_KEY),
+            (winreg.HKEY_LOCAL_MACHINE, PRODUCTS_KEY_64BIT),
+            (winreg.HKEY_CURRENT_USER, VIRTUAL_STORE_PREFIX + PRODUCTS_KEY_64BIT),
+        ]
+
+        installations = []
+
+        for hkey, registry_path in roots:
+            try:
+                with winreg.OpenKey(hkey, registry_path) as registry_key:
+                    for i in range(winreg.QueryInfoKey(registry_key)[0]):
+                        with winreg.OpenKey(registry_key, winreg.EnumKey(registry_key, i)) as subkey:
+                            installation = self._read_product(winreg, subkey)
+
+                            if installation is not None:
+                                installations.append(installation)
+            except OSError:
+                continue
+
+        return installations
+
+    def _read_product(self, winreg, subkey) -> Optional[TrainzInstallation]:
+        try:
+            product_build = str(winreg.QueryValueEx(subkey, "ProductBuild")[0])
+            product_install_path = winreg.QueryValueEx(subkey, "ProductInstallPath")[0]
+        except OSError:
+            return None
+
+        # Check if the product build is a supported number
+        if not product_build.isdigit() or int(product_build) not in SUPPORTED_BUILDS:
+            return None
+
+        return TrainzInstallation(product_install_path, self.name, int(product_build))
+
+
+class FilesystemProvider(DiscoveryProvider):
+    name = "filesystem"
+
+    def __init__(self, roots: Optional[Iterable[Path]] = None, patterns: Iterable[str] = INSTALL_PATTERNS):
+        self.roots = list(roots) if roots is not None else self._default_roots()
+        self.patterns = list(patterns)
+
+    @staticmethod
+    def _default_roots() -> List[Path]:
+        roots = [os.environ.get(name) for name in ("ProgramFiles(x86)", "ProgramFiles", "ProgramW6432")]
+        return [Path(root) for root in dict.fromkeys(roots) if root]
+
+    def find(self) -> List[TrainzInstallation]:
+        # Only candidates, their build is read by the discovery unless another provider knows it
+        return [TrainzInstallation(str(path), self.name) for root in self.roots for pattern in self.patterns for path in root.glob(pattern)]
+
+
+class FakeProvider(DiscoveryProvider):
+    name = "fake"
+
+    def __init__(self, installations: Iterable[TrainzInstallation] = ()):
+        self.installations = list(installations)
+        self.query_count = 0
+
+    def find(self) -> List[TrainzInstallation]:
+        self.query_count += 1
+        return list(self.installations)
+
+
+class TrainzDiscovery:
+    """Finds Trainz installations through several providers queried at the same time.
+
+    Valid installations are cached together with the modification time of their executable, the
+    providers are only queried again once one of them has changed or disappeared.
+    """
+
+    def __init__(self, providers: Optional[List[DiscoveryProvider]] = None):
+        self.providers = providers if providers is not None else [RegistryProvider(), FilesystemProvider()]
+        self._lock = threading.Lock()
+        self._cache: Optional[List[Tuple[TrainzInstallation, float]]] = None
+
+    @staticmethod
+    def _get_mtime(installation: TrainzInstallation) -> Optional[float]:
+        try:
+            return installation.executable.stat().st_mtime
+        except OSError:
+            return None
+
+    def _query_providers(self) -> List[TrainzInstallation]:
+        def query(provider: DiscoveryProvider) -> List[TrainzInstallation]:
+            try:
+                return provider.find()
+            except Exception as e:
+                logger.warning(f"Trainz discovery provider {provider.name} failed", exc_info=e)
+                return []
+
+        with ThreadPoolExecutor(max_workers=max(1, len(self.providers))) as executor:
+            results = list(executor.map(query, self.providers))
+
+        # Keep the order of the providers, the first one to find a path wins
+        installations: Dict[str, TrainzInstallation] = {}
+        for result in results:
+            for installation in result:
+                installations.setdefault(os.path.normcase(os.path.normpath(installation.path)), installation)
+
+        return [installation for installation in map(self._validate_build, installations.values()) if installation is not None]
+
+    @staticmethod
+    def _validate_build(installation: TrainzInstallation) -> Optional[TrainzInstallation]:
+        # Same check as for registered installations, unknown builds are skipped as well
+        if installation.build is None:
+            installation = dataclasses.replace(installation, build=read_build(installation))
+
+        return installation if installation.build is not None and installation.build in SUPPORTED_BUILDS else None
+
+    def _is_cache_valid(self) -> bool:
+        # Look again if nothing was found, Trainz may have been installed in the meantime
+        return bool(self._cache) and all(self._get_mtime(installation) == mtime for installation, mtime in self._cache)
+
+    def find_all(self, refresh: bool = False) -> List[TrainzInstallation]:
+        with self._lock:
+            if refresh or not self._is_cache_valid():
+                cache = []
+
+                # Validate every candidate once, the executable is what makes it an installation
+                for installation in self._query_providers():
+                    mtime = self._get_mtime(installation)
+
+                    if mtime is not None:
+                        cache.append((installation, mtime))
+
+                self._cache = cache
+                logger.info(f"Found {len(cache)} Trainz installations")
+
+            return [installation for installation, _ in self._cache]
+
+    def find_install_path(self, refresh: bool = False) -> Optional[str]:
+        installations = self.find_all(refresh)
+        return installations[0].path if installations else None
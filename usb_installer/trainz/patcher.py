@@ -1,7 +1,15 @@
+import enum
+import hashlib
+import json
+import logging
+import mmap
 import re
-import shutil
 
+from dataclasses import dataclass
 from pathlib import Path
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
 
 strings_to_replace = [
     "sounds/junction/bump.wav",
@@ -15,31 +23,191 @@ strings_to_replace = [
 ]
 
 
-def replace_strings_with_nops(input_file, output_file, strings):
-    with open(input_file, 'rb') as f:
-        data = bytearray(f.read())
+class PatchError(Exception):
+    pass
+
+
+class PatchResult(enum.StrEnum):
+    PATCHED = "patched"
+    ALREADY_PATCHED = "already_patched"
+    ROLLED_BACK = "rolled_back"
+    NOT_PATCHED = "not_patched"
+
+
+@dataclass(frozen=True)
+class Patch:
+    original: bytes
+    replacement: bytes
+
+    def __post_init__(self):
+        if len(self.original) != len(self.replacement):
+            raise ValueError("Patch must not change the length of the patched bytes")
+
+    @classmethod
+    def nop(cls, string: str) -> "Patch":
+        original = string.encode()
+        return cls(original, b"\x90" * len(original))
+
+
+@dataclass(frozen=True)
+class PatchManifest:
+    name: str
+    patches: Tuple[Patch, ...]
+
+    def pattern(self) -> re.Pattern:
+        # One alternation for all patches, longest first so no patch shadows a longer one
+        originals = sorted({patch.original for patch in self.patches}, key=len, reverse=True)
+        return re.compile(b"|".join(re.escape(original) for original in originals))
+
+    def patched_pattern(self) -> re.Pattern:
+        # Patched strings keep their NUL terminator, which tells a run of NOPs apart from padding in code
+        replacements = sorted({patch.replacement for patch in self.patches}, key=len, reverse=True)
+        return re.compile(b"|".join(b"(?<!" + re.escape(replacement[:1]) + b")" + re.escape(replacement) + b"(?=\x00)" for replacement in replacements))
+
+    def get_patch(self, original: bytes) -> Patch:
+        return next(patch for patch in self.patches if patch.original == original)
+
+
+# Removes the junction and slack sounds built into trainz.exe
+SOUNDS_MANIFEST = PatchManifest("sounds", tuple(Patch.nop(string) for string in strings_to_replace))
+
+
+def _state_file(input_file: Path) -> Path:
+    return input_file.with_suffix(input_file.suffix + ".patch.json")
+
+
+def _load_state(input_file: Path) -> Optional[dict]:
+    try:
+        with open(_state_file(input_file), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_state(input_file: Path, state: dict):
+    state_file = _state_file(input_file)
+    temp_file = state_file.with_suffix(".tmp")
+
+    with open(temp_file, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+
+    temp_file.replace(state_file)
+
+
+def _restore(mm: mmap.mmap, entries: List[Tuple[int, bytes]]):
+    for offset, original in entries:
+        mm[offset:offset + len(original)] = original
+
+
+def apply_manifest(input_file: Path, manifest: PatchManifest) -> PatchResult:
+    state = _load_state(input_file)
 
-    for s in strings:
-        pattern = re.compile(re.escape(s.encode()))
-        matches = pattern.finditer(data)
-        for match in matches:
-            start = match.start()
-            end = match.end()
-            data[start:end] = b'\x90' * (end - start)
+    with open(input_file, "r+b") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_WRITE) as mm:
+        file_hash = hashlib.sha1(mm).hexdigest()
 
-    with open(output_file, 'wb') as f:
-        f.write(data)
+        # Nothing to do if the file is still the one patched last time
+        if state is not None and state.get("manifest") == manifest.name and state.get("patched_sha1") == file_hash:
+            logger.info(f"{input_file} is already patched")
+            return PatchResult.ALREADY_PATCHED
 
+        # Find every patch in a single pass over the file
+        matches = [(match.start(), manifest.get_patch(match.group())) for match in manifest.pattern().finditer(mm)]
 
-def patch_sounds(input_file: Path):
+        if not matches:
+            # Patched by an older version without a patch state, or the state has been deleted
+            if manifest.patched_pattern().search(mm) is not None:
+                logger.info(f"{input_file} has already been patched without a patch state, it can't be rolled back")
+                return PatchResult.ALREADY_PATCHED
+
+            raise PatchError(f"None of the patched strings were found in {input_file}")
+
+        missing_count = len({patch.original for patch in manifest.patches} - {patch.original for _, patch in matches})
+        if missing_count > 0:
+            logger.warning(f"{missing_count} of {len(manifest.patches)} patches not found in {input_file}")
+
+        applied = []
+
+        try:
+            for offset, patch in matches:
+                applied.append((offset, patch.original))
+                mm[offset:offset + len(patch.replacement)] = patch.replacement
+        except Exception:
+            # Leave the file as it was
+            _restore(mm, applied)
+            mm.flush()
+            raise
+
+        mm.flush()
+        patched_hash = hashlib.sha1(mm).hexdigest()
+
+    # Keep the original bytes instead of a copy of the whole file for rollback
+    _save_state(input_file, {
+        "manifest": manifest.name,
+        "original_sha1": file_hash,
+        "patched_sha1": patched_hash,
+        "patches": [{"offset": offset, "original": original.hex()} for offset, original in applied],
+    })
+
+    logger.info(f"Applied {len(applied)} patches to {input_file}")
+    return PatchResult.PATCHED
+
+
+def rollback(input_file: Path) -> PatchResult:
+    state = _load_state(input_file)
+
+    if state is None:
+        return PatchResult.NOT_PATCHED
+
+    entries = [(entry["offset"], bytes.fromhex(entry["original"])) for entry in state["patches"]]
+
+    with open(input_file, "r+b") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_WRITE) as mm:
+        file_hash = hashlib.sha1(mm).hexdigest()
+
+        # Replaced by an unpatched file in the meantime, e.g. by a Trainz update
+        if file_hash == state["original_sha1"]:
+            _state_file(input_file).unlink()
+            return PatchResult.NOT_PATCHED
+
+        if file_hash != state["patched_sha1"]:
+            raise PatchError(f"{input_file} has changed since it was patched")
+
+        _restore(mm, entries)
+        mm.flush()
+
+        if hashlib.sha1(mm).hexdigest() != state["original_sha1"]:
+            raise PatchError(f"Verification of restored {input_file} failed")
+
+    _state_file(input_file).unlink()
+    logger.info(f"Rolled back {len(entries)} patches of {input_file}")
+    return PatchResult.ROLLED_BACK
+
+
+def _restore_backup(input_file: Path) -> bool:
     backup_file = input_file.with_suffix(input_file.suffix + ".bak")
 
-    # Check if backup exists and restore it if necessary
-    if backup_file.exists():
-        backup_file.replace(input_file)
+    # Older versions kept a full backup instead of a patch state, it is only valid without one
+    if not backup_file.exists() or _load_state(input_file) is not None:
+        return False
+
+    backup_file.replace(input_file)
+    logger.info(f"Restored {input_file} from the backup of an older version")
+    return True
+
+
+def patch_sounds(input_file: Path) -> PatchResult:
+    # Patch the original file once more, rollback uses the patch state from now on
+    _restore_backup(input_file)
+    return apply_manifest(input_file, SOUNDS_MANIFEST)
+
+
+def unpatch_sounds(input_file: Path) -> PatchResult:
+    if _restore_backup(input_file):
+        return PatchResult.ROLLED_BACK
+
+    state = _load_state(input_file)
 
-    # Create a backup of the original file
-    shutil.copy(input_file, backup_file)
+    # Only roll back the sounds patch, not other manifests applied to the same file
+    if state is None or state.get("manifest") != SOUNDS_MANIFEST.name:
+        return PatchResult.NOT_PATCHED
 
-    # Replace strings with NOPs in the original file
-    replace_strings_with_nops(backup_file, input_file, strings_to_replace)
+    return rollback(input_file)
@@ -1,66 +1,177 @@
+import codecs
 import re
 
+from typing import Dict, Tuple
+
 __all__ = ["Kuid", "TrainzConfig"]
 
 
+KUID_PATTERN = re.compile(r"^(?:kuid:(-?\d+):(\d+)|kuid2:(-?\d+):(\d+):(\d+)|null)$", re.IGNORECASE)
+
+
 class Kuid(str):
+    # No instance dict, the parsed fields are kept once per distinct KUID in _fields
+    __slots__ = ()
+
+    _interned: Dict[str, "Kuid"] = {}
+    _fields: Dict[str, Tuple[int, int, int]] = {}
+
     def __new__(cls, value):
-        if value.startswith("<") and value.endswith(">"):
-            value = value[1:-1]
+        # Every distinct KUID is only parsed and stored once
+        kuid = cls._interned.get(value)
+
+        if kuid is not None:
+            return kuid
+
+        normalized_value = value[1:-1] if value.startswith("<") and value.endswith(">") else value
+        kuid = cls._interned.get(normalized_value.lower())
+
+        if kuid is not None:
+            return kuid
+
+        match = KUID_PATTERN.match(normalized_value)
+
+        if match is None:
+            raise ValueError(f"Invalid KUID: {normalized_value}")
+
+        kuid = str.__new__(cls, normalized_value.lower())
+
+        if match.group(1) is not None:
+            cls._fields[kuid] = (int(match.group(1)), int(match.group(2)), 0)
+        elif match.group(3) is not None:
+            cls._fields[kuid] = (int(match.group(3)), int(match.group(4)), int(match.group(5)))
+        else:
+            cls._fields[kuid] = (0, 0, 0)
 
-        assert re.match(r"^(?:kuid:-?\d+:\d+|kuid2:-?\d+:\d+:\d+|null)$", value, re.IGNORECASE), f"Invalid KUID: {value}"
-        return str.__new__(cls, value.lower())
+        cls._interned[kuid] = kuid
+        return kuid
+
+    def __getnewargs__(self):
+        return (str(self),)
 
     def __repr__(self):
         return f"<{self}>"
 
+    @property
+    def user_id(self) -> int:
+        return self._fields[self][0]
+
+    @property
+    def content_id(self) -> int:
+        return self._fields[self][1]
+
+    @property
+    def version(self) -> int:
+        return self._fields[self][2]
+
+    @property
+    def is_null(self) -> bool:
+        return self == "null"
+
+    @property
+    def sort_key(self) -> Tuple[int, int, int]:
+        return self._fields[self]
+
+
+# Matches quoted strings, KUIDs, floats and integers in a single pass
+VALUE_PATTERN = re.compile(r'^(?:(?P<string>".*")|(?P<kuid><.*>)|(?P<float>[-+]?[0-9]*[.][0-9]+)|(?P<int>[-+]?\d+))$')
+
+# Byte order marks and the encodings they belong to
+BOMS = [
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+
+# Number of bytes fed to chardet when the file isn't valid UTF-8
+DETECT_PREFIX_SIZE = 64 * 1024
+
+
+def detect_encoding(data: bytes) -> str:
+    for bom, encoding in BOMS:
+        if data.startswith(bom):
+            return encoding
+
+    # Most files are plain ASCII or UTF-8
+    try:
+        data.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+
+    import chardet
+    from chardet.universaldetector import UniversalDetector
+
+    detector = UniversalDetector()
+
+    for offset in range(0, min(len(data), DETECT_PREFIX_SIZE), 4096):
+        detector.feed(data[offset:offset + 4096])
+
+        if detector.done:
+            break
+
+    encoding = detector.close()["encoding"]
+
+    # Fall back to the whole file if the prefix wasn't conclusive
+    if encoding is None and len(data) > DETECT_PREFIX_SIZE:
+        encoding = chardet.detect(data)["encoding"]
+
+    return encoding or "utf-8"
+
 
 class TrainzConfig:
     def __init__(self, filename, encoding="utf-8-sig"):
         self.config_data = {}
 
+        with open(filename, "rb") as f:
+            data = f.read()
+
+        if encoding == "auto":
+            encoding = detect_encoding(data)
+
+        # Same line splitting as reading the file in text mode
+        text = data.decode(encoding).replace("\r\n", "\n").replace("\r", "\n")
+
         path = []
         previous_key = None
+        container = None
 
-        if encoding == "auto":
-            try:
-                import chardet
-                encoding = chardet.detect(open(filename, "rb").read())["encoding"]
-            except ModuleNotFoundError as e:
-                raise e
-
-        with open(filename, "r", encoding=encoding) as f:
-            for line in f.readlines():
-                line = line.strip()
-
-                if not line or line.startswith(";"):
-                    continue
-
-                split_line = line.split(maxsplit=1)
-
-                if len(split_line) == 1:
-                    if split_line[0] == "{":
-                        path.append(previous_key)
-                    if split_line[0] == "}":
-                        path.pop()
-                    else:
-                        previous_key = split_line[0]
-                    continue
-
-                key = split_line[0]
-                value = split_line[1]
-
-                if re.match(r'^".*"$', value):
-                    value = value[1:-1]
-                elif re.match(r'^<.*>$', value):
-                    value = Kuid(value)
-                elif re.match(r"^[-+]?([0-9]*[.])[0-9]+$", value):
-                    value = float(value)
-                elif re.match(r"^[-+]?\d+$", value):
-                    value = int(value)
-                elif "," in value:
-                    value = value.split(",")
+        for line in text.split("\n"):
+            line = line.strip()
+
+            if not line or line[0] == ";":
+                continue
+
+            split_line = line.split(maxsplit=1)
 
+            if len(split_line) == 1:
+                if split_line[0] == "{":
+                    path.append(previous_key)
+                    container = None
+                if split_line[0] == "}":
+                    path.pop()
+                    container = None
+                else:
+                    previous_key = split_line[0]
+                continue
+
+            key, value = split_line
+            match = VALUE_PATTERN.match(value)
+
+            if match is None:
+                if "," in value:
+                    value = value.split(",")
+            elif match.lastgroup == "string":
+                value = value[1:-1]
+            elif match.lastgroup == "kuid":
+                value = Kuid(value)
+            elif match.lastgroup == "float":
+                value = float(value)
+            else:
+                value = int(value)
+
+            # Only walk the path again after entering or leaving a block
+            if container is None:
                 container = self.config_data
 
                 for p in path:
@@ -69,7 +180,7 @@ class TrainzConfig:
 
                     container = container[p]
 
-                container[key] = value
+            container[key] = value
 
     def get(self, path, default=None):
         path = path.split(".")
@@ -1,11 +1,20 @@
+import logging
+import queue
 import subprocess
+import threading
+import time
+import uuid
 
 from dataclasses import dataclass
 
 from pathlib import Path
 from typing import List, Optional, Union
 
-__all__ = ["AssetStatus", "TrainzError", "TrainzUtil"]
+from usb_installer.tracing import span
+
+__all__ = ["AssetStatus", "TrainzError", "TrainzUtil", "TrainzUtilSession"]
+
+logger = logging.getLogger(__name__)
 
 
 @dataclass
@@ -23,18 +32,182 @@ class TrainzError(Exception):
     pass
 
 
+# Hide the console window of TrainzUtil.exe on Windows
+CREATE_NO_WINDOW = getattr(subprocess, "CREATE_NO_WINDOW", 0)
+
+# Time to wait for a new session to answer its first command, single commands are used after that. Like
+# the first command of an installation, it has to cover opening the Trainz database.
+SESSION_START_TIMEOUT = 5 * 60
+
+# Replaced with the exit status of the previous command by the session
+EXIT_STATUS_PLACEHOLDER = "$?"
+
+
+class TrainzUtilSession:
+    """TrainzUtil started without arguments, reading commands line by line from stdin.
+
+    The protocol, including the expansion of $? to the exit status of the previous command, is the one
+    of benchmarks/fake_trainzutil.py. TrainzUtil.exe isn't documented to support it, which is why
+    sessions are only used when enabled with persistent=True.
+    """
+
+    def __init__(self, args: List[str]):
+        self.args = args
+        self.process: Optional[subprocess.Popen] = None
+        self.output: queue.Queue = queue.Queue()
+
+    def start(self, timeout: Optional[float] = None):
+        self.output = queue.Queue()
+        self.process = subprocess.Popen(self.args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, encoding="utf-8", text=True, bufsize=1, creationflags=CREATE_NO_WINDOW)
+        threading.Thread(target=self._read_output, args=(self.process, self.output), daemon=True).start()
+
+        # Make sure the process actually accepts commands on stdin and reports their exit status
+        message = uuid.uuid4().hex
+
+        try:
+            process = self.run_command("echo", message, timeout=timeout)
+        except (subprocess.SubprocessError, TrainzError):
+            self.close()
+            raise
+
+        output = process.stdout.splitlines()
+
+        if not output or output[-1].strip() != message:
+            self.close()
+            raise TrainzError("TrainzUtil does not support persistent sessions")
+
+    @staticmethod
+    def _read_output(process: subprocess.Popen, output: queue.Queue):
+        for line in process.stdout:
+            output.put(line.rstrip("\r\n"))
+
+        # Signal the end of the output stream
+        output.put(None)
+
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def run_command(self, command: str, *args, timeout: Optional[float] = None) -> subprocess.CompletedProcess:
+        if not self.is_alive():
+            raise TrainzError("TrainzUtil session is not running")
+
+        # Each command is followed by an echo of a unique marker and its exit status to find the end of its output
+        marker = f"__end_{uuid.uuid4().hex}__"
+        self.process.stdin.write(subprocess.list2cmdline([command, *args]) + "\n")
+        self.process.stdin.write(subprocess.list2cmdline(["echo", marker, EXIT_STATUS_PLACEHOLDER]) + "\n")
+        self.process.stdin.flush()
+
+        deadline = time.monotonic() + timeout if timeout else None
+        output = []
+
+        while True:
+            try:
+                line = self.output.get(timeout=max(0.0, deadline - time.monotonic()) if deadline else None)
+            except queue.Empty:
+                self.close()
+                raise subprocess.TimeoutExpired([*self.args, command, *args], timeout, "\n".join(output))
+
+            if line is None:
+                returncode = self.process.wait()
+                raise subprocess.CalledProcessError(returncode, [*self.args, command, *args], "\n".join(output))
+
+            if line.strip().startswith(marker):
+                return subprocess.CompletedProcess([*self.args, command, *args], self._parse_exit_status(line, marker), "\n".join(output), "")
+
+            output.append(line)
+
+    def _parse_exit_status(self, line: str, marker: str) -> int:
+        status = line.strip()[len(marker):].strip()
+
+        # Without the exit status failed commands that don't print an error line would pass as successful
+        if not status.lstrip("-").isdigit():
+            self.close()
+            raise TrainzError("TrainzUtil session does not report exit status")
+
+        return int(status)
+
+    def close(self):
+        if self.process is None:
+            return
+
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+
+        self.process = None
+
+
 class TrainzUtil:
-    def __init__(self, trainz_path: Union[Path, str], timeout: Optional[float] = None):
+    def __init__(self, trainz_path: Union[Path, str], timeout: Optional[float] = None, persistent: bool = False, executable: Optional[List[str]] = None):
         trainzutil_path = Path(trainz_path) / "bin" / "TrainzUtil.exe"
 
-        if not trainzutil_path.exists():
+        if executable is None and not trainzutil_path.exists():
             raise FileNotFoundError(f"TrainzUtil.exe not found at: {trainz_path}")
 
         self.trainzutil_path = trainzutil_path
+        self.executable = executable or [str(trainzutil_path)]
         self.timeout = timeout
+        self.persistent = persistent
+        self._session: Optional[TrainzUtilSession] = None
+
+        # Only one command at a time may access the Trainz database, in a session or not
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def command_time(self) -> float:
+        """Total time the commands of the calling thread took to run, without waiting for the lock."""
+        return getattr(self._local, "command_time", 0.0)
+
+    def _get_session(self) -> Optional[TrainzUtilSession]:
+        if not self.persistent:
+            return None
+
+        if self._session is not None and self._session.is_alive():
+            return self._session
+
+        # Start a new session or restart one that has exited
+        session = TrainzUtilSession(self.executable)
+
+        try:
+            session.start(timeout=SESSION_START_TIMEOUT)
+        except (OSError, subprocess.SubprocessError, TrainzError) as e:
+            logger.warning("Persistent TrainzUtil session not available, falling back to single commands", exc_info=e)
+            self.persistent = False
+            return None
+
+        self._session = session
+        return session
+
+    def _run_process(self, command: str, *args, timeout: Optional[float] = None) -> subprocess.CompletedProcess:
+        session = self._get_session()
+
+        if session is None:
+            return subprocess.run([*self.executable, command, *args], capture_output=True, encoding="utf-8", text=True, timeout=timeout, creationflags=CREATE_NO_WINDOW)
+
+        try:
+            return session.run_command(command, *args, timeout=timeout)
+        finally:
+            # A session in use while closing is closed once its command has finished
+            if not self.persistent:
+                self._close_session()
+
+    def _close_session(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
 
     def run_command(self, command: str, *args, timeout: Optional[float] = None) -> List[str]:
-        process = subprocess.run([self.trainzutil_path, command, *args], capture_output=True, encoding="utf-8", text=True, timeout=timeout if timeout else self.timeout, creationflags=subprocess.CREATE_NO_WINDOW)
+        with span(command, "trainzutil", args=" ".join(str(arg) for arg in args)), self._lock:
+            start_time = time.perf_counter()
+
+            try:
+                process = self._run_process(command, *args, timeout=timeout if timeout else self.timeout)
+            finally:
+                self._local.command_time = self.command_time + time.perf_counter() - start_time
+
         output = process.stdout.splitlines()
 
         for line in output:
@@ -46,6 +219,17 @@ class TrainzUtil:
 
         return output
 
+    def close(self):
+        self.persistent = False
+
+        # Don't wait for a running command, it closes the session once it has finished. The timeout
+        # covers a command that is just returning and has checked the flag before it was cleared.
+        if self._lock.acquire(timeout=1):
+            try:
+                self._close_session()
+            finally:
+                self._lock.release()
+
     def build_version(self, timeout: Optional[float] = None) -> int:
         output = self.run_command("version", timeout=timeout)
         return int(output[0].split()[1])
@@ -24,3 +24,15 @@ def readable_size(size: int) -> str:
     units = ('KB', 'MB', 'GB', 'TB')
     size_list = [f'{int(size):,} B'] + [f'{int(size) / 1024 ** (i + 1):,.1f} {u}' for i, u in enumerate(units)]
     return [size for size in size_list if not size.startswith('0.')][-1]
+
+
+def format_duration(seconds: float) -> str:
+    """Convert a duration to a short German label (e.g. 1 Std. 5 Min.)."""
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds} Sek."
+    minutes, seconds = divmod(seconds, 60)
+    if minutes < 60:
+        return f"{minutes} Min. {seconds} Sek."
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours} Std. {minutes} Min."
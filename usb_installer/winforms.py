@@ -1,21 +1,36 @@
 import enum
+import functools
 
+from types import SimpleNamespace
 from typing import Optional
 from usb_installer import DLL_PATH
 
-import clr
 
-clr.AddReference("System")
-clr.AddReference("System.Windows.Forms")
+@functools.lru_cache(maxsize=None)
+def _load_clr() -> SimpleNamespace:
+    # Loading the .NET assemblies is slow, only do it once they are actually needed
+    import clr
 
-import System
-import System.Windows.Forms as WinForms
+    clr.AddReference("System")
+    clr.AddReference("System.Windows.Forms")
 
-clr.AddReference(str(DLL_PATH / "Microsoft.WindowsAPICodePack.dll"))
-clr.AddReference(str(DLL_PATH / "Microsoft.WindowsAPICodePack.Shell.dll"))
+    import System
+    import System.Windows.Forms as WinForms
 
-from Microsoft.WindowsAPICodePack.Dialogs import CommonOpenFileDialog, CommonFileDialogResult
-from Microsoft.WindowsAPICodePack.Taskbar import TaskbarManager, TaskbarProgressBarState
+    clr.AddReference(str(DLL_PATH / "Microsoft.WindowsAPICodePack.dll"))
+    clr.AddReference(str(DLL_PATH / "Microsoft.WindowsAPICodePack.Shell.dll"))
+
+    from Microsoft.WindowsAPICodePack.Dialogs import CommonOpenFileDialog, CommonFileDialogResult
+    from Microsoft.WindowsAPICodePack.Taskbar import TaskbarManager, TaskbarProgressBarState
+
+    return SimpleNamespace(
+        System=System,
+        WinForms=WinForms,
+        CommonOpenFileDialog=CommonOpenFileDialog,
+        CommonFileDialogResult=CommonFileDialogResult,
+        TaskbarManager=TaskbarManager,
+        TaskbarProgressBarState=TaskbarProgressBarState,
+    )
 
 
 class MessageBoxButtons(enum.IntEnum):
@@ -66,8 +81,10 @@ def show_message_box(
     buttons: MessageBoxButtons = MessageBoxButtons.OK,
     icon: MessageBoxIcon = MessageBoxIcon.INFORMATION,
     default_button: MessageBoxDefaultButton = MessageBoxDefaultButton.BUTTON1,
-    window: Optional[WinForms.IWin32Window] = None,
+    window: Optional["System.Windows.Forms.IWin32Window"] = None,
 ) -> DialogResult:
+    net = _load_clr()
+    System, WinForms = net.System, net.WinForms
     args = [message, title, System.Enum.ToObject(WinForms.MessageBoxButtons, buttons), System.Enum.ToObject(WinForms.MessageBoxIcon, icon), System.Enum.ToObject(WinForms.MessageBoxDefaultButton, default_button)]
 
     if window:
@@ -79,9 +96,10 @@ def show_message_box(
 def show_folder_picker_dialog(
     title: Optional[str] = None,
     initial_directory: Optional[str] = None,
-    window: Optional[WinForms.IWin32Window] = None,
+    window: Optional["System.Windows.Forms.IWin32Window"] = None,
 ) -> Optional[str]:
-    dialog = CommonOpenFileDialog()
+    net = _load_clr()
+    dialog = net.CommonOpenFileDialog()
     dialog.IsFolderPicker = True
 
     if title:
@@ -90,7 +108,7 @@ def show_folder_picker_dialog(
     if initial_directory:
         dialog.InitialDirectory = initial_directory
 
-    if dialog.ShowDialog(window.Handle) == CommonFileDialogResult.Ok and dialog.FileName:
+    if dialog.ShowDialog(window.Handle) == net.CommonFileDialogResult.Ok and dialog.FileName:
         return dialog.FileName
 
     return None
@@ -101,7 +119,8 @@ def set_taskbar_progress(
     value: Optional[int] = None,
     max_value: Optional[int] = None,
 ):
-    TaskbarManager.Instance.SetProgressState(System.Enum.ToObject(TaskbarProgressBarState, state))
+    net = _load_clr()
+    net.TaskbarManager.Instance.SetProgressState(net.System.Enum.ToObject(net.TaskbarProgressBarState, state))
 
     if value is not None and max_value is not None:
-        TaskbarManager.Instance.SetProgressValue(value, max_value)
+        net.TaskbarManager.Instance.SetProgressValue(value, max_value)